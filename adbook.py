@@ -0,0 +1,287 @@
+"""Compact columnar storage for one side of one exchange's ads.
+
+An AdBook keeps price, available amount and min/max limits in typed
+arrays, the merchant as an interned id, and the payment methods as the
+id of an interned bitset (one bit per interned canonical method id, see
+catalog.py). It still
+behaves like a read-only list of ad dicts (len, indexing, iteration), so
+code that only reads a few ads doesn't need to care.
+"""
+
+import json
+import threading
+from array import array
+from math import isfinite
+
+import catalog
+
+
+class _Interner:
+    """Value <-> small int table, shared by every book.
+
+    ``encoded`` holds each value's JSON text and ``expanded`` the result of
+    ``expand(value)``, both computed once at intern time. compact() frees
+    the ids of values no book has used for a whole compaction interval, and
+    later interns reuse them, so the table tracks the live books.
+    """
+
+    def __init__(self, encode=json.dumps, expand=None):
+        self.ids = {}
+        self.values = []
+        self.encoded = []
+        self.expanded = []
+        # Compactions so far; _used[id] is the generation the id was last interned or found live
+        self.generation = 0
+        self._used = []
+        self._free = []
+        self._encode = encode
+        self._expand = expand
+        self._lock = threading.Lock()
+
+    def intern(self, value):
+        i = self.ids.get(value)
+        if i is not None:
+            self._used[i] = self.generation
+            # Still there: a compact() from now on sees it as just used
+            if self.ids.get(value) == i:
+                return i
+        with self._lock:
+            i = self.ids.get(value)
+            if i is None:
+                encoded = self._encode(value)
+                expanded = self._expand(value) if self._expand else value
+                # Publish the lists before the id so readers never miss an entry
+                if self._free:
+                    i = self._free.pop()
+                    self.values[i], self.encoded[i], self.expanded[i] = value, encoded, expanded
+                else:
+                    self.values.append(value)
+                    self.encoded.append(encoded)
+                    self.expanded.append(expanded)
+                    self._used.append(self.generation)
+                    i = len(self.values) - 1
+                self.ids[value] = i
+            self._used[i] = self.generation
+        return i
+
+    def compact(self, live):
+        """Free the ids that are not in ``live`` and were neither live nor
+        interned since the previous compaction. Returns how many were freed."""
+        with self._lock:
+            self.generation += 1
+            used = self._used
+            for i in live:
+                used[i] = self.generation
+            stale = self.generation - 1
+            freed = [(value, i) for value, i in self.ids.items() if used[i] < stale]
+            for value, i in freed:
+                del self.ids[value]
+                self.values[i] = self.encoded[i] = self.expanded[i] = None
+                self._free.append(i)
+        return len(freed)
+
+
+MERCHANTS = _Interner()
+METHODS = _Interner()
+
+
+def method_ids(mask):
+    """Canonical ids of the payment methods whose bits are set in ``mask``."""
+    ids = []
+    i = 0
+    while mask:
+        if mask & 1:
+            ids.append(METHODS.values[i])
+        mask >>= 1
+        i += 1
+    return ids
+
+
+def method_names(mask):
+    """Display names of the payment methods whose bits are set in ``mask``."""
+    return [catalog.name(cid) for cid in method_ids(mask)]
+
+
+# Method bitsets; ``expanded`` is the list of method names, ``encoded`` its JSON
+MASKS = _Interner(
+    encode=lambda mask: json.dumps(method_names(mask)),
+    expand=method_names,
+)
+
+
+def method_mask(ids):
+    """Bitset of the given canonical payment-method ids (interning new ones)."""
+    mask = 0
+    for cid in ids:
+        mask |= 1 << METHODS.intern(cid)
+    return mask
+
+
+# Functions returning books still in use (snapshots, caches), see compact()
+_live_sources = []
+
+
+def add_live_source(books):
+    """Have compact() keep the merchants and methods of every book ``books()`` returns."""
+    _live_sources.append(books)
+
+
+def books_in(price_data):
+    """Every AdBook in the results of a price_data mapping."""
+    for data in price_data.values():
+        for result in data.get("results", ()):
+            for value in result.values():
+                if isinstance(value, AdBook):
+                    yield value
+
+
+def compact():
+    """Recycle the ids of merchants, method sets and methods no live book uses.
+
+    A value is only freed once it has been unused for a whole interval
+    between compactions, so books being built meanwhile are safe.
+    Returns the number of (merchants, method sets, methods) freed.
+    """
+    books = {id(book): book for source in _live_sources for book in source()}
+    merchants, masks = set(), set()
+    for book in books.values():
+        merchants.update(book.merchant_ids)
+        masks.update(book.mask_ids)
+    freed = MERCHANTS.compact(merchants), MASKS.compact(masks)
+    # Methods stay while any remaining method set has their bit
+    methods = set()
+    for mask in list(MASKS.values):
+        i = 0
+        while mask:
+            if mask & 1:
+                methods.add(i)
+            mask >>= 1
+            i += 1
+    return (*freed, METHODS.compact(methods))
+
+
+_AD_JSON = (
+    '{"price":%r,"available_amount":%r,"min_amount":%r,"max_amount":%r,'
+    '"merchant":%s,"payment_methods":%s}'
+)
+
+
+class AdBook:
+    """Ads for one (exchange, side), stored column by column."""
+
+    COLUMNS = ("price", "available", "min_amount", "max_amount", "merchant_ids", "mask_ids")
+    # _json caches to_json() until the book changes
+    __slots__ = COLUMNS + ("_json",)
+
+    def __init__(self):
+        self.price = array("d")
+        self.available = array("d")
+        self.min_amount = array("d")
+        self.max_amount = array("d")
+        self.merchant_ids = array("I")
+        self.mask_ids = array("I")
+        self._json = None
+
+    def append(self, price, available, min_amount, max_amount, merchant, payment_methods):
+        """Add an ad; ``payment_methods`` are canonical ids (catalog.from_exchange).
+
+        Ads with an infinite or NaN number are dropped: to_json couldn't write them.
+        """
+        if not (isfinite(price) and isfinite(available) and isfinite(min_amount) and isfinite(max_amount)):
+            return
+        self.price.append(price)
+        self.available.append(available)
+        self.min_amount.append(min_amount)
+        self.max_amount.append(max_amount)
+        self.merchant_ids.append(MERCHANTS.intern(merchant))
+        self.mask_ids.append(MASKS.intern(method_mask(payment_methods)))
+        self._json = None
+
+    def extend(self, other):
+        """Add every ad of ``other`` after this book's own."""
+        for name in self.COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+        self._json = None
+
+    @classmethod
+    def from_ads(cls, ads):
+        """Book holding a list of ad dicts (as found in the JSON payloads)."""
+        book = cls()
+        for ad in ads:
+            book.append(
+                ad["price"], ad["available_amount"], ad["min_amount"], ad["max_amount"],
+                ad["merchant"], [catalog.canonical_id(name) for name in ad["payment_methods"]],
+            )
+        return book
+
+    def select(self, positions):
+        """New book holding only the ads at ``positions``, in that order."""
+        book = AdBook()
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            setattr(book, name, array(column.typecode, (column[i] for i in positions)))
+        return book
+
+    def mask(self, i):
+        return MASKS.values[self.mask_ids[i]]
+
+    def row(self, i):
+        """Ad ``i`` as a tuple of its columns (merchant and methods as ids)."""
+        return (
+            self.price[i], self.available[i], self.min_amount[i], self.max_amount[i],
+            self.merchant_ids[i], self.mask_ids[i],
+        )
+
+    def fingerprints(self):
+        """One hashable fingerprint per ad (its row), to tell which ads changed between books."""
+        return zip(
+            self.price, self.available, self.min_amount, self.max_amount,
+            self.merchant_ids, self.mask_ids,
+        )
+
+    def price_stats(self):
+        """(count, lowest, highest, mean) over positive prices; None values when empty."""
+        prices = self.price
+        if prices and min(prices) <= 0:
+            prices = array("d", (p for p in prices if p > 0))
+        if not prices:
+            return 0, None, None, None
+        return len(prices), min(prices), max(prices), sum(prices) / len(prices)
+
+    def to_json(self):
+        """JSON array of the ads, written straight from the columns (once per book contents)."""
+        if self._json is None:
+            merchants = MERCHANTS.encoded
+            methods = MASKS.encoded
+            self._json = "[" + ",".join(
+                _AD_JSON % (p, a, lo, hi, merchants[m], methods[k])
+                for p, a, lo, hi, m, k in self.fingerprints()
+            ) + "]"
+        return self._json
+
+    def __len__(self):
+        return len(self.price)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return {
+            "price": self.price[i],
+            "available_amount": self.available[i],
+            "min_amount": self.min_amount[i],
+            "max_amount": self.max_amount[i],
+            "merchant": MERCHANTS.values[self.merchant_ids[i]],
+            "payment_methods": list(MASKS.expanded[self.mask_ids[i]]),
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return isinstance(other, AdBook) and all(
+            getattr(self, name) == getattr(other, name) for name in self.COLUMNS
+        )
+
+    __hash__ = None
+
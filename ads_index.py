@@ -0,0 +1,144 @@
+"""Per-refresh indexes over each fiat's merged ads, for server-side filtering.
+
+Built once per snapshot so /api/ads can answer exchange, payment-method,
+amount, sort and pagination queries without walking every ad. Works on
+the exchanges' AdBooks; ad dicts are only built for the requested page.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+import catalog
+from adbook import MASKS, METHODS, method_ids
+
+SORTS = ("best", "price_asc", "price_desc", "available")
+
+
+class SideIndex:
+    """All exchanges' ads for one side of one fiat, best price first.
+
+    Positions in the merged order are the currency of every sub-index:
+    ascending position order is best-price order.
+    """
+
+    def __init__(self, results, side):
+        entries = [
+            (price, r["exchange"], book, i)
+            for r in results
+            for book in (r.get(f"{side}_ads"),) if book
+            for i, price in enumerate(book.price)
+        ]
+        # We buy cheapest first and sell to the highest bidder first
+        entries.sort(key=lambda e: e[0], reverse=(side == "sell"))
+        self.side = side
+        self.exchanges = [e[1] for e in entries]
+        self._refs = [(e[2], e[3]) for e in entries]
+        self.price = array("d", (e[0] for e in entries))
+        self.available = array("d", (book.available[i] for _, _, book, i in entries))
+        self.min_amount = array("d", (book.min_amount[i] for _, _, book, i in entries))
+        self.max_amount = array("d", (book.max_amount[i] for _, _, book, i in entries))
+
+        self.by_exchange = {}
+        self.by_mask = {}
+        for pos, (_, exchange, book, i) in enumerate(entries):
+            self.by_exchange.setdefault(exchange, set()).add(pos)
+            self.by_mask.setdefault(book.mask_ids[i], set()).add(pos)
+
+        # Payment-method prefix index: lower-cased display names in sorted
+        # order, so a prefix is a contiguous range, each with its method bit
+        bits = {}
+        for mask_id in self.by_mask:
+            for cid in method_ids(MASKS.values[mask_id]):
+                key = catalog.name(cid).lower()
+                bits[key] = bits.get(key, 0) | (1 << METHODS.ids[cid])
+        self.method_names = sorted(bits)
+        self.method_bits = [bits[name] for name in self.method_names]
+
+        # Interval index over [min_amount, max_amount]: both endpoints sorted
+        count = len(entries)
+        self.min_order = sorted(range(count), key=self.min_amount.__getitem__)
+        self.min_values = [self.min_amount[p] for p in self.min_order]
+        self.max_order = sorted(range(count), key=self.max_amount.__getitem__)
+        self.max_values = [self.max_amount[p] for p in self.max_order]
+
+    def __len__(self):
+        return len(self.price)
+
+    def ad(self, pos):
+        """The ad at merged position ``pos`` as a dict tagged with its exchange."""
+        book, i = self._refs[pos]
+        return {**book[i], "exchange": self.exchanges[pos]}
+
+    def payment_matches(self, prefixes):
+        """Positions of ads with any of the given payment methods.
+
+        Each entry matches its method in any exchange's spelling (by
+        canonical id), or else any method whose name starts with it.
+        """
+        wanted = 0
+        names = self.method_names
+        for prefix in prefixes:
+            bit = METHODS.ids.get(catalog.lookup_id(prefix))
+            if bit is not None:
+                wanted |= 1 << bit
+                continue
+            prefix = prefix.lower()
+            i = bisect_left(names, prefix)
+            while i < len(names) and names[i].startswith(prefix):
+                wanted |= self.method_bits[i]
+                i += 1
+        matched = set()
+        for mask_id, positions in self.by_mask.items():
+            if MASKS.values[mask_id] & wanted:
+                matched |= positions
+        return matched
+
+    def _amount_matches(self, amount):
+        """Positions of ads whose min/max limits include ``amount``."""
+        # Ads with min <= amount, and ads with max >= amount; walk the
+        # shorter list and check the other bound directly.
+        low = self.min_order[:bisect_right(self.min_values, amount)]
+        high = self.max_order[bisect_left(self.max_values, amount):]
+        if len(low) <= len(high):
+            return {p for p in low if self.max_amount[p] >= amount}
+        return {p for p in high if self.min_amount[p] <= amount}
+
+    def query(self, exchanges=None, payments=None, amount=None, sort="best",
+              page=1, page_size=12):
+        """Filter, sort and paginate. Returns (total matches, list of ads on the page)."""
+        selected = None
+        if exchanges:
+            selected = set()
+            for name in exchanges:
+                selected |= self.by_exchange.get(name, set())
+        if payments:
+            matched = self.payment_matches(payments)
+            selected = matched if selected is None else selected & matched
+        if amount:
+            matched = self._amount_matches(amount)
+            selected = matched if selected is None else selected & matched
+
+        positions = range(len(self)) if selected is None else sorted(selected)
+
+        if sort == "available":
+            positions = sorted(positions, key=lambda p: -self.available[p])
+        elif (sort == "price_asc" and self.side == "sell") or (sort == "price_desc" and self.side == "buy"):
+            positions = positions[::-1]
+
+        start = (page - 1) * page_size
+        return len(positions), [self.ad(p) for p in positions[start:start + page_size]]
+
+
+def build_ads_index(data):
+    """Index one fiat's results. Returns {"buy", "sell", "payment_methods"}."""
+    results = data.get("results", [])
+    buy = SideIndex(results, "buy")
+    sell = SideIndex(results, "sell")
+    methods = {
+        name
+        for index in (buy, sell)
+        for mask_id in index.by_mask
+        for name in MASKS.expanded[mask_id]
+        if name
+    }
+    return {"buy": buy, "sell": sell, "payment_methods": sorted(methods, key=str)}
@@ -1,44 +1,123 @@
 """Flask web server for P2P Price Fetcher."""
 
+import math
 import threading
 import time
 
-from flask import Flask, jsonify, render_template, request
-from config import HOST, PORT, REFRESH_INTERVAL, PAIRS
-from fetchers import fetch_all_pairs, _now
+from flask import Flask, g, jsonify, render_template, request
+from ads_index import SORTS
+from config import (
+    ASSET, BACKGROUND_FETCH, HOST, ON_DEMAND, PORT, REFRESH_INTERVAL, REFRESH_MODE, PAIRS,
+    SHARED_SNAPSHOT, WARM_SNAPSHOT, SSE_HEARTBEAT, SSE_MAX_DURATION, SSE_MAX_CLIENTS,
+)
+from fetchers import asset_key, fetch_all_pairs, pair_key, _now
+import deltas
+import demand
+import history
+import matrix
+import metrics
+import scheduler
+import shared
+import snapshot
+from payloads import EMPTY_PRICES, NOT_AVAILABLE
+from transport import format_timing_summary
 
 app = Flask(__name__)
 app.config["TEMPLATES_AUTO_RELOAD"] = True
 
-# Shared state: keyed by fiat currency code
-price_data = {p["fiat"]: {"results": [], "last_refresh": None} for p in PAIRS}
-data_lock = threading.Lock()
+# Price data lives in snapshot.current(): an immutable, versioned Snapshot
+# replaced wholesale by the background fetcher, so request handlers never lock.
 _fetcher_started = False
 
+# Open /api/stream connections in this worker
+_stream_clients = 0
+_stream_lock = threading.Lock()
+
 
 def background_fetcher():
     """Continuously fetch P2P prices for all pairs in the background."""
+    if REFRESH_MODE == "adaptive":
+        scheduler.run_forever()
+        return
     while True:
+        cycle_start = time.time()
         try:
-            all_data = fetch_all_pairs()
-            with data_lock:
-                for fiat, data in all_data.items():
-                    price_data[fiat] = data
-            print(f"[{_now('%H:%M:%S')}] All pairs refreshed successfully")
+            pairs, evicted = demand.rotation() if ON_DEMAND else (PAIRS, ())
+            # On demand, nobody may have asked for anything lately
+            if evicted:
+                scheduler.publish_results([], evicted)
+            if pairs:
+                # Each exchange is published as soon as it lands
+                fetch_all_pairs(pairs, on_result=scheduler.publish_results)
+                print(f"[{_now('%H:%M:%S')}] All pairs refreshed (v{snapshot.current().version})")
+            timing = format_timing_summary(since=cycle_start)
+            if timing:
+                print(timing)
         except Exception as e:
             print(f"[{_now('%H:%M:%S')}] Error refreshing prices: {e}")
 
         time.sleep(REFRESH_INTERVAL)
 
 
+def _warm_start_and_fetch():
+    """Serve the saved snapshot while the first refresh runs, keep saving, then fetch."""
+    if WARM_SNAPSHOT:
+        if snapshot.current().version == 0:
+            shared.restore(WARM_SNAPSHOT, {pair_key(p) for p in PAIRS})
+        shared.persist(WARM_SNAPSHOT)
+    background_fetcher()
+
+
 def start_fetcher():
     """Start background fetcher once (safe to call multiple times)."""
     global _fetcher_started
     if not _fetcher_started:
         _fetcher_started = True
-        t = threading.Thread(target=background_fetcher, daemon=True)
+        if SHARED_SNAPSHOT:
+            # Every worker serves; the one that wins the lock also fetches
+            t = threading.Thread(target=shared.run, args=(_warm_start_and_fetch,), daemon=True)
+            t.start()
+            print(f"Following shared snapshot {SHARED_SNAPSHOT}")
+            return
+        t = threading.Thread(target=_warm_start_and_fetch, daemon=True)
         t.start()
-        print(f"Background fetcher started (every {REFRESH_INTERVAL}s)")
+        if REFRESH_MODE == "adaptive":
+            print("Background fetcher started (adaptive schedule)")
+        else:
+            print(f"Background fetcher started (every {REFRESH_INTERVAL}s)")
+
+
+metrics.Gauge(
+    "p2p_snapshot_age_seconds", "Seconds since the current snapshot was published.",
+    lambda: snapshot.current().age(),
+)
+metrics.Gauge(
+    "p2p_snapshot_version", "Version of the current snapshot.",
+    lambda: snapshot.current().version,
+)
+metrics.Gauge("p2p_stream_clients", "Open /api/stream connections.", lambda: _stream_clients)
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    endpoint = request.endpoint or "unmatched"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint)
+    metrics.REQUESTS.inc(endpoint, str(response.status_code))
+    # Streams have no size until they close
+    if not response.is_streamed:
+        metrics.RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Counters and histograms in the Prometheus text format."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 
 @app.route("/")
@@ -46,50 +125,274 @@ def index():
     return render_template(
         "index.html",
         refresh_interval=REFRESH_INTERVAL,
-        pairs=PAIRS,
+        pairs=[{**p, "key": pair_key(p), "asset": p.get("asset", ASSET)} for p in PAIRS],
     )
 
 
+def _asset_fiat(value):
+    """(asset, fiat) for a ``fiat`` value: "BTC/ETB", or a fiat with ?asset= (default ASSET)."""
+    value = value.upper()
+    if "/" in value:
+        asset, fiat = value.split("/", 1)
+        return asset, fiat
+    return request.args.get("asset", ASSET).upper(), value
+
+
+def _fiat_arg():
+    """Snapshot key for the request's ``fiat`` and ``asset`` (and, on demand, ``pay``) parameters.
+
+    In on-demand mode this registers the request and fetches the pair if
+    needed (see demand.py).
+    """
+    asset, fiat = _asset_fiat(request.args.get("fiat", PAIRS[0]["fiat"]))
+    if not ON_DEMAND:
+        return asset_key(asset, fiat)
+    return demand.request(fiat, _list_arg("pay"), asset)
+
+
 @app.route("/api/price/simple")
 def api_price_simple():
-    fiat = request.args.get("fiat", PAIRS[0]["fiat"]).upper()
+    fiat = _fiat_arg()
     exchange = request.args.get("exchange", "").lower()
     field = request.args.get("field", "best_sell")
-    with data_lock:
-        data = price_data.get(fiat, {"results": []})
-        results = data.get("results", [])
-
-        # Specific exchange
-        if exchange:
-            for r in results:
-                if r.get("exchange", "").lower() == exchange:
-                    val = r.get(f"{field}_price", r.get(field))
-                    if val is not None:
-                        return str(val), 200, {"Content-Type": "text/plain"}
-            return "N/A", 200, {"Content-Type": "text/plain"}
-
-        # No exchange: best across all (max for sell, min for buy)
-        values = []
-        for r in results:
-            val = r.get(f"{field}_price", r.get(field))
-            if val is not None:
-                values.append(val)
-        if not values:
-            return "N/A", 200, {"Content-Type": "text/plain"}
-        best = max(values) if "sell" in field else min(values)
-        return str(best), 200, {"Content-Type": "text/plain"}
+    text = snapshot.current().simple_index.get((fiat, exchange, field), NOT_AVAILABLE)
+    return text, 200, {"Content-Type": "text/plain"}
+
+
+@app.route("/api/price/matrix")
+def api_price_matrix():
+    """Many fiats, exchanges and fields as one CSV/TSV grid (a whole sheet in one IMPORTDATA)."""
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in matrix.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(matrix.FORMATS)}"}), 400
+    pairs = [_asset_fiat(f) for f in _list_arg("fiats")]
+    if ON_DEMAND:
+        fiats = [demand.request(fiat, (), asset) for asset, fiat in pairs]
+    else:
+        fiats = [asset_key(asset, fiat) for asset, fiat in pairs]
+    snap = snapshot.current()
+    payload = matrix.matrix_payload(
+        snap, fiats, _list_arg("exchanges"), _list_arg("fields"), fmt,
+    )
+    mimetype = "text/csv" if fmt == "csv" else "text/tab-separated-values"
+    return _payload_response(payload, mimetype, headers=_snapshot_headers(snap))
+
+
+def _snapshot_headers(snap):
+    """Version and age (seconds) of the snapshot a response came from.
+
+    While results restored at startup are still served, the age is theirs.
+    """
+    return {"X-Snapshot-Version": snap.token, "X-Snapshot-Age": f"{snap.data_age():.0f}"}
+
+
+def _payload_response(payload, mimetype="application/json", headers=None):
+    """Serve a pre-encoded payload: 304 if the client's ETag matches, gzip if accepted."""
+    headers = {
+        **(headers or {}),
+        "ETag": f'"{payload["etag"]}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if request.if_none_match.contains(payload["etag"]):
+        return app.response_class(status=304, headers=headers)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        body = payload["gzip"]
+    else:
+        body = payload["body"]
+    # Bodies adopted from a shared snapshot are memoryviews over its mmap;
+    # as a one-item list Werkzeug sends them as-is instead of iterating bytes
+    return app.response_class([body], mimetype=mimetype, headers=headers)
 
 
 @app.route("/api/prices")
 def api_prices():
-    fiat = request.args.get("fiat", PAIRS[0]["fiat"]).upper()
-    with data_lock:
-        data = price_data.get(fiat, {"results": [], "last_refresh": None})
-        return jsonify(data)
+    fiat = _fiat_arg()
+    snap = snapshot.current()
+    headers = _snapshot_headers(snap)
+    # since=<version token>: only what changed after that version (see deltas.py)
+    since = request.args.get("since")
+    if since is not None:
+        return _payload_response(deltas.delta_payload(fiat, since, snap), headers=headers)
+    # ads=0 drops the per-ad lists (the dashboard pages ads through /api/ads)
+    payloads = snap.summaries if request.args.get("ads") == "0" else snap.payloads
+    return _payload_response(payloads.get(fiat, EMPTY_PRICES), headers=headers)
+
+
+def _stream_events(fiat, payloads_attr, version):
+    """Yield SSE frames: the fiat's payload whenever it changes, comments as heartbeats."""
+    sent_etag = None
+    deadline = time.time() + SSE_MAX_DURATION
+    yield b"retry: 3000\n\n"
+    while time.time() < deadline:
+        snap = snapshot.wait_for_update(version, timeout=SSE_HEARTBEAT)
+        if snap.version <= version:
+            yield b": ping\n\n"
+            continue
+        version = snap.version
+        payload = getattr(snap, payloads_attr).get(fiat, EMPTY_PRICES)
+        # Other fiats' updates bump the version too; only send real changes
+        if payload["etag"] == sent_etag:
+            continue
+        sent_etag = payload["etag"]
+        yield b"id: %s\nevent: prices\ndata: %s\n\n" % (snap.token.encode(), payload["body"])
+
+
+def _stream_closed():
+    global _stream_clients
+    with metrics.lock_wait(_stream_lock, "stream_clients"):
+        _stream_clients -= 1
+
+
+@app.route("/api/stream")
+def api_stream():
+    """Push the fiat's prices over Server-Sent Events as soon as a refresh publishes.
+
+    Sends the ad-free summary unless ``ads=1``. A reconnecting client's
+    Last-Event-ID (a snapshot version token) suppresses the initial push if
+    it is already current.
+    """
+    global _stream_clients
+    fiat = _fiat_arg()
+    payloads_attr = "payloads" if request.args.get("ads") == "1" else "summaries"
+    # Start one version back so the current data is pushed right away,
+    # unless the client already has it (same version of the same boot)
+    current = snapshot.current()
+    version = current.version
+    if request.headers.get("Last-Event-ID") != current.token:
+        version -= 1
+
+    with metrics.lock_wait(_stream_lock, "stream_clients"):
+        if _stream_clients >= SSE_MAX_CLIENTS:
+            return jsonify({"error": "too many streams, poll /api/prices"}), 503
+        _stream_clients += 1
+
+    response = app.response_class(
+        _stream_events(fiat, payloads_attr, version),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(_stream_closed)
+    return response
+
+
+@app.route("/api/history")
+def api_history():
+    """Downsampled price history: OHLC per bucket for one field, per exchange."""
+    fiat = asset_key(*_asset_fiat(request.args.get("fiat", PAIRS[0]["fiat"])))
+    field = request.args.get("field", "best_sell")
+    if history.resolve_field(field) is None:
+        return jsonify({"error": f"field must be one of {', '.join(history.FIELDS)}"}), 400
+    end = request.args.get("end", time.time(), type=float)
+    start = request.args.get("start", end - 86400, type=float)
+    if not (math.isfinite(start) and math.isfinite(end)) or start > end:
+        return jsonify({"error": "start and end must be timestamps with start <= end"}), 400
+    bucket = request.args.get("bucket", type=int)
+    if bucket is None:
+        bucket = history.default_bucket(start, end)
+    elif bucket <= 0:
+        return jsonify({"error": "bucket must be a positive number of seconds"}), 400
+    else:
+        # At most MAX_POINTS buckets per series
+        bucket = max(bucket, math.ceil((end - start) / history.MAX_POINTS))
+    names = _list_arg("exchange") or history.exchanges(fiat)
+    return jsonify({
+        "fiat": fiat,
+        "field": history.resolve_field(field),
+        "start": int(start),
+        "end": int(end),
+        "bucket": bucket,
+        "columns": ["time", "open", "high", "low", "close", "samples"],
+        "series": {
+            name: history.ohlc(fiat, name, field, start, end, bucket) for name in names
+        },
+    })
+
+
+def _list_arg(name):
+    """Comma-separated query parameter as a list (empty entries dropped)."""
+    return [v.strip() for v in request.args.get(name, "").split(",") if v.strip()]
+
+
+@app.route("/api/ads")
+def api_ads():
+    fiat = _fiat_arg()
+    snap = snapshot.current()
+    side = request.args.get("side", "buy").lower()
+    sort = request.args.get("sort", "best")
+    if side not in ("buy", "sell") or sort not in SORTS:
+        return jsonify({"error": f"side must be buy/sell and sort one of {', '.join(SORTS)}"}), 400
+    amount = request.args.get("amount", type=float) or 0
+    if not math.isfinite(amount) or amount < 0:
+        return jsonify({"error": "amount must be a non-negative number"}), 400
+    page = max(request.args.get("page", 1, type=int), 1)
+    page_size = min(max(request.args.get("page_size", 12, type=int), 1), 100)
+
+    index = snap.ads_index.get(fiat)
+    if index is None:
+        total, ads, methods = 0, [], []
+    else:
+        total, ads = index[side].query(
+            exchanges=_list_arg("exchanges"),
+            payments=_list_arg("payments"),
+            amount=amount,
+            sort=sort,
+            page=page,
+            page_size=page_size,
+        )
+        methods = index["payment_methods"]
+    return jsonify({
+        "fiat": fiat,
+        "side": side,
+        "version": snap.token,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": -(-total // page_size),
+        "payment_methods": methods,
+        "ads": ads,
+    })
+
+
+@app.route("/api/arbitrage")
+def api_arbitrage():
+    """Executable cross-exchange arbitrage found in the fiat's latest books."""
+    fiat = _fiat_arg()
+    snap = snapshot.current()
+    payload = snap.arbitrage.get(fiat)
+    if payload is None:
+        return jsonify({"error": f"unknown fiat {fiat}"}), 404
+    return _payload_response(payload, headers=_snapshot_headers(snap))
+
+
+@app.route("/api/quote")
+def api_quote():
+    """Effective price of filling ``amount`` fiat, merged across exchanges and per exchange."""
+    fiat = _fiat_arg()
+    snap = snapshot.current()
+    side = request.args.get("side", "buy").lower()
+    amount = request.args.get("amount", type=float)
+    if side not in ("buy", "sell") or not amount or not math.isfinite(amount) or amount <= 0:
+        return jsonify({"error": "side must be buy/sell and amount a positive number"}), 400
+    payments = _list_arg("payments")
+    books = snap.quotes.get(fiat)
+    if books is None:
+        return jsonify({"error": f"unknown fiat {fiat}"}), 404
+    return jsonify({
+        "fiat": fiat,
+        "side": side,
+        "amount": amount,
+        "payments": payments,
+        "version": snap.token,
+        "depth_columns": ["fiat", "crypto", "effective_price"],
+        **books[side].quote(amount, payments),
+    })
 
 
 # Start fetcher when module loads (works with both gunicorn and python app.py)
-start_fetcher()
+if BACKGROUND_FETCH:
+    start_fetcher()
 
 if __name__ == "__main__":
     print(f"P2P Price Fetcher on http://localhost:{PORT}")
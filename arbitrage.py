@@ -0,0 +1,142 @@
+"""Cross-exchange arbitrage: buy ads priced below some sell ad's price.
+
+After each refresh, every updated fiat's books are merged best first with
+a heap (buy ads cheapest first, sell ads highest first) and crossed like
+an order book. A buy ad and a sell ad only match if they share a payment
+method (an AND of their canonical method bitsets, see catalog.py) and a
+trade size fits both ads'
+min/max limits and available amounts. Each match consumes size from both
+ads, so the listed opportunities are executable together.
+
+The buy side includes each exchange's crossed buy ads (priced at or below
+that exchange's own best sell), which _build_result keeps out of buy_ads.
+"""
+
+import heapq
+from itertools import takewhile
+
+from adbook import method_names
+from payloads import encode_payload
+
+# Opportunities listed per fiat (counts and totals cover all of them)
+MAX_OPPORTUNITIES = 200
+
+# Below this much crypto an ad counts as used up
+_EPSILON = 1e-9
+
+class _Leg:
+    """One ad's side of a trade, with the crypto it has left."""
+
+    __slots__ = ("exchange", "book", "i", "price", "low", "left", "methods")
+
+    def __init__(self, exchange, book, i):
+        self.exchange = exchange
+        self.book = book
+        self.i = i
+        self.price = price = book.price[i]
+        cap = book.available[i] * price
+        if book.max_amount[i] > 0:
+            cap = min(cap, book.max_amount[i])
+        # Limits are in fiat; legs trade crypto
+        self.low = book.min_amount[i] / price
+        self.left = cap / price
+        self.methods = book.mask(i)
+
+    def tradable(self):
+        return self.left > _EPSILON and self.left >= self.low and bool(self.methods)
+
+
+def _merged(results, keys, highest_first):
+    """Heap-merge every exchange's books under ``keys`` into one best-first stream of legs."""
+    streams = []
+    for r in results:
+        for key in keys:
+            book = r.get(key)
+            if not book:
+                continue
+            order = sorted(
+                (i for i, p in enumerate(book.price) if p > 0),
+                key=book.price.__getitem__, reverse=highest_first,
+            )
+            streams.append([(r["exchange"], book, i) for i in order])
+    return heapq.merge(*streams, key=lambda e: e[1].price[e[2]], reverse=highest_first)
+
+
+def _opportunity(ask, bid, size, methods):
+    spread = bid.price - ask.price
+    return {
+        "buy_exchange": ask.exchange,
+        "buy_merchant": ask.book[ask.i]["merchant"],
+        "buy_price": ask.price,
+        "sell_exchange": bid.exchange,
+        "sell_merchant": bid.book[bid.i]["merchant"],
+        "sell_price": bid.price,
+        "payment_methods": sorted(method_names(methods)),
+        "size": round(size, 6),
+        "buy_amount": round(size * ask.price, 2),
+        "sell_amount": round(size * bid.price, 2),
+        "spread": round(spread, 4),
+        "spread_pct": round(spread / ask.price * 100, 4),
+        "profit": round(size * spread, 2),
+        "same_exchange": ask.exchange == bid.exchange,
+    }
+
+
+def find_opportunities(data):
+    """Cross one fiat's books. Returns the matched trades, cheapest buy ad first."""
+    # Stale books may have changed since; only cross live ones
+    results = [r for r in data.get("results", []) if not r.get("error") and not r.get("stale")]
+    asks = (_Leg(*e) for e in _merged(results, ("buy_ads", "crossed_buy_ads"), False))
+    ask = next(asks, None)
+    if ask is None:
+        return []
+    # Only sell ads above the cheapest buy ad can ever match
+    bids = [
+        _Leg(*e) for e in takewhile(
+            lambda e: e[1].price[e[2]] > ask.price,
+            _merged(results, ("sell_ads",), True),
+        )
+    ]
+    bids = [b for b in bids if b.tradable()]
+
+    trades = []
+    while ask is not None and bids and ask.price < bids[0].price:
+        for bid in bids:
+            if bid.price <= ask.price or not ask.tradable():
+                break
+            if not bid.tradable():
+                continue
+            shared = ask.methods & bid.methods
+            size = min(ask.left, bid.left)
+            if not shared or size < max(ask.low, bid.low):
+                continue
+            trades.append(_opportunity(ask, bid, size, shared))
+            ask.left -= size
+            bid.left -= size
+        bids = [b for b in bids if b.tradable()]
+        ask = next(asks, None)
+    return trades
+
+
+def scan(data):
+    """One fiat's arbitrage report."""
+    trades = find_opportunities(data)
+    return {
+        "last_refresh": data.get("last_refresh"),
+        "count": len(trades),
+        "total_size": round(sum(t["size"] for t in trades), 6),
+        "total_profit": round(sum(t["profit"] for t in trades), 2),
+        "opportunities": trades[:MAX_OPPORTUNITIES],
+    }
+
+
+def encode_reports(price_data):
+    """Scan and encode each given fiat's /api/arbitrage payload. Returns dict keyed by fiat."""
+    payloads = {}
+    for fiat, data in price_data.items():
+        report = scan(data)
+        if report["count"]:
+            print(f"[{fiat}] {report['count']} arbitrage opportunities, "
+                  f"{report['total_profit']} {fiat} total")
+        payloads[fiat] = encode_payload({"fiat": fiat, **report})
+    return payloads
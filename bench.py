@@ -0,0 +1,87 @@
+"""Refresh-cycle benchmark against the replay stand-in (no network needed).
+
+    python bench.py [--cycles 5] [--latency 0.05] [--jitter 0.02] [--errors 0]
+                    [--pages 5] [--fixtures fixtures]
+
+Starts a stand-in server over the fixtures (see replay.py), points the
+fetchers at it and runs full refresh cycles: fetch every pair, then
+publish the snapshot. Reports cycle wall time and, per exchange, requests
+per cycle, time to first byte and JSON parse time.
+"""
+
+import argparse
+import statistics
+import time
+
+import fetchers
+import snapshot
+import transport
+from replay import FIXTURES_DIR, start_stand_in
+
+
+def run(cycles=5, **options):
+    """Run ``cycles`` refreshes against a stand-in. Returns per-cycle measurements."""
+    server = start_stand_in(**options)
+    transport.set_upstream(f"http://127.0.0.1:{server.server_port}")
+    runs = []
+    try:
+        for _ in range(cycles):
+            start = time.time()
+            data = fetchers.fetch_all_pairs()
+            fetched = time.time()
+            snapshot.publish(data)
+            published = time.time()
+            runs.append({
+                "fetch": fetched - start,
+                "publish": published - fetched,
+                "errors": sum(
+                    1 for d in data.values() for r in d["results"] if r.get("error")
+                ),
+                "exchanges": transport.timing_summary(since=start),
+            })
+    finally:
+        transport.set_upstream("")
+        server.shutdown()
+    return runs
+
+
+def _ms(values):
+    return f"{statistics.median(values) * 1000:8.1f}ms (min {min(values) * 1000:.1f}, max {max(values) * 1000:.1f})"
+
+
+def report(runs):
+    print(f"{len(runs)} cycles")
+    print(f"  fetch   {_ms([r['fetch'] for r in runs])}")
+    print(f"  publish {_ms([r['publish'] for r in runs])}")
+    print(f"  errors  {sum(r['errors'] for r in runs)} results")
+    names = sorted({name for r in runs for name in r["exchanges"]})
+    print(f"  {'exchange':<10}{'req/cycle':>10}{'ttfb avg':>12}{'parse/cycle':>14}{'KiB/cycle':>11}")
+    for name in names:
+        stats = [r["exchanges"][name] for r in runs if name in r["exchanges"]]
+        n = len(runs)
+        print(
+            f"  {name:<10}"
+            f"{sum(s['requests'] for s in stats) / n:>10.1f}"
+            f"{statistics.mean(s['ttfb_ms_avg'] for s in stats):>10.1f}ms"
+            f"{sum(s['parse_ms_total'] for s in stats) / n:>12.1f}ms"
+            f"{sum(s['bytes'] for s in stats) / n / 1024:>11.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--errors", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=None)
+    args = parser.parse_args()
+    report(run(
+        args.cycles, fixtures=args.fixtures, latency=args.latency, jitter=args.jitter,
+        errors=args.errors, pages=args.pages,
+    ))
+
+
+if __name__ == "__main__":
+    main()
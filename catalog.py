@@ -0,0 +1,233 @@
+"""Canonical payment-method catalog shared by every exchange.
+
+Exchanges name the same method differently ("Tele Birr" / "Telebirr",
+"DukascopyBank" / "Dukascopy") and some send ids instead of names (MEXC,
+Bybit). Every method gets one canonical id: the lower-case letters and
+digits of its name, mapped through ALIASES. Ads carry canonical ids (see
+adbook.py), so comparing or filtering methods is a set or bitmask
+operation, and display names come from name().
+
+Reverse indexes give each exchange's own identifiers for a canonical id,
+for the payment filters sent upstream.
+
+Tables an exchange serves (MEXC's method list) are cached in CATALOG_FILE.
+On startup the cached copy is used as is; once older than CATALOG_TTL it is
+refreshed on a background thread.
+"""
+
+import json
+import os
+import threading
+import time
+
+from config import CATALOG_FILE, CATALOG_TTL
+
+# Canonical id -> display name, for methods whose name varies between exchanges
+CANONICAL = {
+    "cbe": "CBE",
+    "telebirr": "Tele Birr",
+    "awashbank": "Awash Bank",
+    "bankofabyssinia": "Bank of Abyssinia",
+    "dashenbank": "Dashen Bank",
+    "wegagenbank": "Wegagen Bank",
+    "hibretbank": "Hibret Bank",
+    "nibbank": "Nib Bank",
+    "oromiabank": "Oromia Bank",
+    "ebirr": "Ebirr",
+    "amole": "Amole",
+    "banktransfer": "Bank Transfer",
+    "mobilemoney": "Mobile Money",
+    "dukascopy": "Dukascopy",
+    "payoneer": "Payoneer",
+    "wise": "Wise",
+}
+
+# Other spellings (as slugs) -> canonical id
+ALIASES = {
+    "commercialbankofethiopia": "cbe",
+    "cbebirr": "cbe",
+    "dukascopybank": "dukascopy",
+    "transferwise": "wise",
+    "bank": "banktransfer",
+    "banktransferethiopia": "banktransfer",
+    "hellocash": "mobilemoney",
+}
+
+# Identifiers each exchange uses, -> canonical id. Filled from the
+# exchange where it serves a list (register_source), static otherwise.
+EXCHANGE_IDS = {
+    "Bybit": {
+        "629": "cbe", "630": "telebirr", "631": "awashbank",
+        "632": "bankofabyssinia", "633": "dashenbank", "634": "wegagenbank",
+        "635": "hibretbank", "636": "nibbank", "637": "oromiabank",
+        "638": "ebirr", "639": "amole", "6": "banktransfer",
+        "14": "banktransfer", "40": "mobilemoney", "41": "mobilemoney",
+        "97": "mobilemoney", "178": "banktransfer",
+        "582": "payoneer", "62": "payoneer",
+    },
+    "Binance": {"DukascopyBank": "dukascopy", "Payoneer": "payoneer"},
+    "OKX": {"Dukascopy": "dukascopy", "Payoneer": "payoneer"},
+    "MEXC": {},
+}
+
+# Display names of every canonical id seen so far (first name wins)
+_names = dict(CANONICAL)
+# (exchange, canonical id) -> that exchange's identifiers
+_reverse = {}
+# Bumped whenever the exchange tables change; see transport's parsed-page cache
+generation = 0
+
+# Exchange -> function returning {exchange id: name}, for tables fetched upstream
+_sources = {}
+_loaded_at = None
+_lock = threading.Lock()
+_refreshing = False
+
+
+def _slug(name):
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+def canonical_id(name):
+    """Canonical id for a method name (any exchange's spelling)."""
+    slug = _slug(name)
+    cid = ALIASES.get(slug, slug)
+    if cid not in _names:
+        _names[cid] = name
+    return cid
+
+
+def lookup_id(name):
+    """Canonical id for a method name if it is a known method, else None.
+
+    For query input: unlike canonical_id, unknown names aren't registered.
+    """
+    slug = _slug(name)
+    cid = ALIASES.get(slug, slug)
+    return cid if cid in _names else None
+
+
+def from_exchange(exchange, value):
+    """Canonical id for a method as ``exchange`` reported it (its id or name)."""
+    value = str(value).strip()
+    cid = EXCHANGE_IDS.get(exchange, {}).get(value)
+    if cid is not None:
+        return cid
+    if value.isdigit():
+        # An id the exchange's table doesn't know (yet)
+        return canonical_id(f"Method {value}")
+    return canonical_id(value)
+
+
+def name(cid):
+    """Display name of a canonical id."""
+    return _names.get(cid, cid)
+
+
+def _index():
+    global _reverse
+    reverse = {}
+    for exchange, table in EXCHANGE_IDS.items():
+        for value, cid in table.items():
+            reverse.setdefault((exchange, cid), []).append(value)
+    # Swapped in whole so readers never see a partial index
+    _reverse = reverse
+
+
+def exchange_ids(exchange, names, fallback=True):
+    """``exchange``'s identifiers for the methods in ``names`` (any spelling).
+
+    Methods the exchange has no identifier for are passed on as given if
+    ``fallback`` is set, else left out.
+    """
+    ids = []
+    for method in names:
+        known = _reverse.get((exchange, lookup_id(method)))
+        if known:
+            ids.extend(known)
+        elif fallback:
+            ids.append(method)
+    # Different spellings of one method resolve to the same identifiers
+    return list(dict.fromkeys(ids))
+
+
+# ---------------------------------------------------------------------------
+# Exchange-provided tables, cached on disk
+# ---------------------------------------------------------------------------
+def register_source(exchange, fetch):
+    """Let ``fetch()`` ({exchange id: name}) fill ``exchange``'s table when the cache is missing or old."""
+    _sources[exchange] = fetch
+
+
+def _apply(tables):
+    global EXCHANGE_IDS, generation
+    ids = {exchange: dict(table) for exchange, table in EXCHANGE_IDS.items()}
+    for exchange, table in tables.items():
+        ids.setdefault(exchange, {}).update(
+            {value: canonical_id(method) for value, method in table.items()}
+        )
+    # Swapped in whole: fetch threads may be iterating the old tables
+    EXCHANGE_IDS = ids
+    _index()
+    generation += 1
+
+
+def _read_cache():
+    try:
+        with open(CATALOG_FILE) as f:
+            cached = json.load(f)
+        return cached["fetched_at"], cached["exchanges"]
+    except (OSError, ValueError, KeyError):
+        return None, {}
+
+
+def _refresh():
+    """Fetch every source's table and cache them. Keeps the old tables on failure."""
+    global _loaded_at, _refreshing
+    try:
+        tables = {}
+        for exchange, fetch in _sources.items():
+            try:
+                tables[exchange] = fetch()
+                print(f"[{exchange}] Loaded {len(tables[exchange])} payment methods")
+            except Exception as e:
+                print(f"[{exchange}] Payment method load error: {e}")
+        if not tables:
+            return
+        _apply(tables)
+        _loaded_at = time.time()
+        _, cached = _read_cache()
+        tmp = f"{CATALOG_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"fetched_at": _loaded_at, "exchanges": {**cached, **tables}}, f)
+            os.replace(tmp, CATALOG_FILE)
+        except OSError as e:
+            print(f"[catalog] Could not write {CATALOG_FILE}: {e}")
+    finally:
+        _refreshing = False
+
+
+def ensure_loaded():
+    """Load the cached tables once, fetching them now only if there is no cache.
+
+    A cache older than CATALOG_TTL is served while a background refresh runs.
+    """
+    global _loaded_at, _refreshing
+    if _loaded_at is not None and time.time() - _loaded_at < CATALOG_TTL:
+        return
+    with _lock:
+        if _loaded_at is None:
+            fetched_at, tables = _read_cache()
+            if fetched_at is None:
+                _refreshing = True
+                _refresh()
+                return
+            _apply(tables)
+            _loaded_at = fetched_at
+        if time.time() - _loaded_at >= CATALOG_TTL and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh, daemon=True).start()
+
+
+_index()
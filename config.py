@@ -2,24 +2,136 @@
 
 import os
 
-# Crypto asset to track
+# Crypto asset to track (for pairs and requests that name no other)
 ASSET = "USDT"
 
-# Currency pairs to track: fiat, display label, payment method filters
-# Empty pay_filter means fetch all payment methods
+# Currency pairs to track: fiat, display label, payment method filters and
+# optionally "asset" (default ASSET). Empty pay_filter means fetch all
+# payment methods. Pairs of another asset are keyed "BTC/ETB" in the
+# snapshot and the API (?fiat=BTC/ETB or ?asset=BTC&fiat=ETB).
 PAIRS = [
     {"fiat": "ETB", "label": "USDT/ETB", "pay_filter": []},
     {"fiat": "USD", "label": "USDT/USD", "pay_filter": ["Dukascopy", "Payoneer"]},
     {"fiat": "EUR", "label": "USDT/EUR", "pay_filter": ["Dukascopy", "Payoneer"]},
 ]
 
+# More assets to track for every pair above (env ASSETS, e.g. "USDC,BTC,ETH").
+# Each adds only its own requests: sessions, payment-method tables and the
+# refresh schedule are shared.
+PAIRS += [
+    {**pair, "asset": asset, "label": f"{asset}/{pair['fiat']}"}
+    for asset in dict.fromkeys(a.strip() for a in os.environ.get("ASSETS", "").upper().split(","))
+    if asset and asset != ASSET
+    for pair in PAIRS
+]
+
 # How often to refresh prices (in seconds)
 REFRESH_INTERVAL = 30
 
+# "adaptive": each (pair, exchange) refreshes on its own schedule (scheduler.py);
+# "cycle": every pair and exchange together every REFRESH_INTERVAL seconds
+REFRESH_MODE = os.environ.get("REFRESH_MODE", "adaptive")
+
+# Adaptive scheduler. Each (pair, exchange) starts at REFRESH_INTERVAL; a best
+# price moving more than volatile_pct (%) halves its interval, moving less than
+# stable_pct grows it 1.5x, within [min_interval, max_interval]. Failures back
+# off exponentially from backoff_base up to backoff_max (429s pause the whole
+# exchange, honoring Retry-After). After breaker_failures failures in a row the
+# circuit opens: the last good result is served marked stale, and one probe is
+# sent every breaker_cooldown seconds (doubling up to backoff_max) until it recovers.
+SCHEDULER = {
+    "min_interval": 10,
+    "max_interval": 120,
+    "volatile_pct": 0.3,
+    "stable_pct": 0.05,
+    "backoff_base": 15,
+    "backoff_max": 600,
+    "breaker_failures": 3,
+    "breaker_cooldown": 60,
+}
+
+# On-demand mode (ON_DEMAND=1): any fiat a client asks for (?fiat=GBP, optionally
+# &pay=Wise,Revolut) is fetched when first requested, and the background
+# rotation covers only pairs requested in the last idle seconds (PAIRS count as
+# requested at startup). A first request waits up to wait seconds for the
+# fetch; data older than ttl seconds is served while it refreshes. On-demand
+# pairs idle for evict seconds leave the snapshot; at most max_pairs are tracked.
+ON_DEMAND = os.environ.get("ON_DEMAND", "") == "1"
+DEMAND = {
+    "ttl": 60,
+    "idle": 900,
+    "evict": 3600,
+    "wait": 30,
+    "max_pairs": 50,
+}
+
 # Pagination for exchange API requests
 PAGE_SIZE = 20       # Ads per API page request
 MAX_PAGES = 10       # Max pages to fetch per side (safety cap)
 
+# Concurrent refresh: max parallel requests per exchange host (each exchange
+# gets that many worker threads), and seconds a refresh cycle waits before
+# publishing without stragglers
+EXCHANGE_CONCURRENCY = {"MEXC": 2, "Binance": 4, "Bybit": 4, "OKX": 2}
+CYCLE_DEADLINE = 25
+
+# Adaptive pagination: stop paging a side once the price has moved more than
+# price_band_pct past the best price, or once the ads fetched so far offer
+# liquidity_target units of the pair's asset (per asset; assets not listed
+# stop on the band only). Every full_depth_every-th cycle (starting with the
+# first) pages the whole book. A pair may override any of these with a
+# "pagination" dict, optionally per side: {"sell": {"price_band_pct": 1}}.
+PAGINATION = {
+    "price_band_pct": 2.0,
+    "liquidity_target": {"USDT": 25000, "USDC": 25000, "BTC": 0.4, "ETH": 10},
+    "full_depth_every": 10,
+}
+
+# Payment-method catalog (catalog.py): exchange-provided method tables are
+# cached in this file and refreshed in the background once older than the TTL (s)
+CATALOG_FILE = os.environ.get("CATALOG_FILE", "payment_methods.json")
+CATALOG_TTL = 86400
+
+# Snapshots kept for /api/prices?since=<version> deltas; older clients get a full resync
+DELTA_HISTORY = 100
+
+# Seconds between recycling interned merchants and payment-method sets that
+# no live book has used for a whole interval (adbook.compact)
+INTERN_COMPACT_INTERVAL = 600
+
+# Price history (SQLite file) and how long samples are kept
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+HISTORY_RETENTION_DAYS = 180
+
+# Server-Sent Events (/api/stream): seconds between keep-alive comments,
+# seconds before a stream is closed (browsers reconnect and resume), and
+# max concurrent streams per worker. Each stream holds one of the worker's
+# gunicorn threads (32, see Dockerfile), so streams get at most a quarter
+# of them and the rest always serve normal requests; past the cap clients
+# poll instead.
+SSE_HEARTBEAT = 15
+SSE_MAX_DURATION = 600
+SERVER_THREADS = 32
+SSE_MAX_CLIENTS = SERVER_THREADS // 4
+
+# Send every exchange request to this base URL instead, as
+# <UPSTREAM_URL>/<original host>/<path> (the replay stand-in, see replay.py)
+UPSTREAM_URL = os.environ.get("UPSTREAM_URL", "")
+
+# Multi-worker serving: with a path set (e.g. /dev/shm/p2p-snapshot), the
+# gunicorn workers elect one fetcher through a lock file next to it; it writes
+# every snapshot there and the other workers serve straight from the file.
+SHARED_SNAPSHOT = os.environ.get("SHARED_SNAPSHOT", "")
+
+# Set to 0 to serve without the background fetcher (loadtest.py publishes
+# synthetic snapshots instead)
+BACKGROUND_FETCH = os.environ.get("BACKGROUND_FETCH", "1") == "1"
+
+# Warm start: the last snapshot is saved here (in the background, after
+# publishes) and its results served at startup, marked stale ("restored")
+# until each is refetched. Empty disables.
+WARM_SNAPSHOT = os.environ.get("WARM_SNAPSHOT", "snapshot.bin")
+
 # Flask server — Render sets PORT via environment variable
 HOST = "0.0.0.0"
 PORT = int(os.environ.get("PORT", 5000))
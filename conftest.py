@@ -0,0 +1,20 @@
+"""Fixtures shared by the tests."""
+
+import pytest
+
+from adbook import AdBook
+
+
+@pytest.fixture
+def book():
+    """Factory for AdBooks from (price, available, merchant, methods[, min_amount, max_amount]) tuples.
+
+    Limits default to 1 to 100000 fiat.
+    """
+    def make(*ads):
+        book = AdBook()
+        for price, available, merchant, methods, *limits in ads:
+            min_amount, max_amount = limits or (1.0, 100000.0)
+            book.append(price, available, min_amount, max_amount, merchant, methods)
+        return book
+    return make
@@ -0,0 +1,168 @@
+"""Ad-level diffs between snapshots, served by /api/prices?since=<version>.
+
+Ads have no upstream id, so each gets one from its merchant, payment
+methods and occurrence count in the exchange's list:
+``"<merchant>|<method>,<method>|<n>"``. A delta lists, per exchange and
+ad list (``buy``, ``sell``, ``crossed_buy``), ads ``added`` and ``changed`` (with their ``id``) and the ids
+``removed``, plus the summary ``fields`` that changed. Applying it to a
+map of id -> ad built from the previous state gives exactly the new
+state; ads are then ordered by price.
+
+Versions are identified by the snapshot's token, ``"<epoch>-<version>"``:
+version numbers restart with each process, so a ``since`` from another
+boot never matches and gets a full resync.
+"""
+
+import threading
+from collections import deque
+
+import metrics
+from adbook import MASKS, MERCHANTS, AdBook, add_live_source, books_in
+from config import DELTA_HISTORY
+from payloads import AD_LIST_KEYS, encode_payload
+
+class _Version:
+    """What a retained version needs for diffing: not the snapshot's encoded payloads."""
+
+    __slots__ = ("version", "token", "price_data")
+
+    def __init__(self, snap):
+        self.version = snap.version
+        self.token = snap.token
+        self.price_data = snap.price_data
+
+
+# Recent versions, oldest first, kept so older versions can be diffed
+_history = deque(maxlen=DELTA_HISTORY)
+add_live_source(lambda: (book for v in list(_history) for book in books_in(v.price_data)))
+
+# Encoded deltas for the current version, keyed by (fiat, since, version)
+_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_LIMIT = 256
+
+_MISSING = object()
+_EMPTY_BOOK = AdBook()
+
+
+def ad_ids(ads):
+    """Map each ad's id to its position in ``ads``, numbering repeats of the same merchant and methods."""
+    seen = {}
+    ids = {}
+    for i, key in enumerate(zip(ads.merchant_ids, ads.mask_ids)):
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        ids[(*key, n)] = i
+    return ids
+
+
+def _id_text(key):
+    merchant, mask, n = key
+    return f'{MERCHANTS.values[merchant]}|{",".join(MASKS.expanded[mask])}|{n}'
+
+
+def _diff_side(old_ads, new_ads):
+    if old_ads is new_ads:
+        return None
+    old = ad_ids(old_ads)
+    new = ad_ids(new_ads)
+    added = [{**new_ads[i], "id": _id_text(k)} for k, i in new.items() if k not in old]
+    changed = [
+        {**new_ads[i], "id": _id_text(k)} for k, i in new.items()
+        if k in old and old_ads.row(old[k]) != new_ads.row(i)
+    ]
+    removed = [_id_text(k) for k in old if k not in new]
+    if not (added or changed or removed):
+        return None
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def diff_fiat(old, new):
+    """Diff two versions of one fiat's price data."""
+    if old is new:
+        return {"exchanges": {}, "removed_exchanges": []}
+
+    old_results = {r["exchange"]: r for r in old.get("results", [])}
+    exchanges = {}
+    for r in new.get("results", []):
+        prev = old_results.pop(r["exchange"], None) or {}
+        if prev is r:
+            continue
+        entry = {}
+        fields = {
+            k: v for k, v in r.items()
+            if k not in AD_LIST_KEYS and prev.get(k, _MISSING) != v
+        }
+        if fields:
+            entry["fields"] = fields
+        for key in AD_LIST_KEYS:
+            side_delta = _diff_side(prev.get(key, _EMPTY_BOOK), r.get(key, _EMPTY_BOOK))
+            if side_delta:
+                entry[key[:-len("_ads")]] = side_delta
+        if entry:
+            exchanges[r["exchange"]] = entry
+
+    delta = {"exchanges": exchanges, "removed_exchanges": list(old_results)}
+    if old.get("last_refresh") != new.get("last_refresh"):
+        delta["last_refresh"] = new.get("last_refresh")
+    return delta
+
+
+def _find(token):
+    if not _history:
+        return None
+    epoch, _, version = token.rpartition("-")
+    if not version.isdigit():
+        return None
+    pos = int(version) - _history[0].version
+    if 0 <= pos < len(_history) and _history[pos].token == token:
+        return _history[pos]
+    # Versions adopted from another process (shared.py) can have gaps
+    for retained in _history:
+        if retained.token == token:
+            return retained
+    return None
+
+
+def _cached(key, build):
+    payload = _cache.get(key)
+    if payload is None:
+        payload = build()
+        with metrics.lock_wait(_cache_lock, "delta_cache"):
+            # Entries for older versions are never asked for again
+            if len(_cache) >= _CACHE_LIMIT:
+                _cache.clear()
+            _cache[key] = payload
+    return payload
+
+
+def delta_payload(fiat, since, snap):
+    """Encoded delta for ``fiat`` from version token ``since`` to ``snap``.
+
+    Falls back to a full resync (``"full": true`` with the whole payload
+    under ``"data"``) when ``since`` is no longer retained or comes from
+    another boot.
+    """
+    base = _find(since)
+    if base is None:
+        return _cached((fiat, None, snap.token), lambda: encode_payload({
+            "version": snap.token,
+            "since": since,
+            "full": True,
+            "data": snap.price_data.get(fiat, {"results": [], "last_refresh": None}),
+        }))
+    return _cached((fiat, since, snap.token), lambda: encode_payload({
+        "version": snap.token,
+        "since": since,
+        "full": False,
+        **diff_fiat(base.price_data.get(fiat, {}), snap.price_data.get(fiat, {})),
+    }))
+
+
+def record(snap, updated_fiats):
+    """Retain ``snap``'s data and precompute each updated fiat's delta from the previous version."""
+    previous = _history[-1].token if _history else None
+    _history.append(_Version(snap))
+    if previous is not None:
+        for fiat in updated_fiats:
+            delta_payload(fiat, previous, snap)
@@ -0,0 +1,231 @@
+"""Demand-driven refresh: fetch whatever fiats clients ask for, while they ask.
+
+With config.ON_DEMAND set, a request for any fiat (optionally with an
+``asset`` and a ``pay=`` filter) registers demand for that pair:
+
+- Never fetched: the request triggers a fetch and waits for it (up to
+  DEMAND["wait"] seconds). Concurrent requests for the same pair share one
+  fetch.
+- Fetched more than DEMAND["ttl"] seconds ago: the cached data is served
+  immediately and a refresh starts in the background (stale-while-revalidate),
+  whether or not the rotation is about to refresh it.
+- The background rotation (scheduler or cycle) covers only pairs requested
+  within DEMAND["idle"] seconds. On-demand pairs idle for DEMAND["evict"]
+  seconds are dropped from the snapshot and the fetch caches. Configured
+  PAIRS are never dropped.
+
+With a shared snapshot (shared.py), workers that don't fetch record demand
+as marker files in ``<SHARED_SNAPSHOT>.demand/`` (the file's mtime is the
+last request) and wait for the fetching worker to publish the pair.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+import history
+import snapshot
+from config import ASSET, DEMAND, PAIRS, SHARED_SNAPSHOT
+from fetchers import TZ_OFFSET, asset_key, fetch_all_pairs, forget_pair, pair_key
+
+_CONFIGURED = {pair_key(p): p for p in PAIRS}
+
+# Pair key -> {"pair": pair dict, "requested": last request time}
+_demand = {}
+_lock = threading.Lock()
+
+# Pair key -> future of the fetch running for it
+_fetches = {}
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="demand")
+
+# False in workers that only serve a shared snapshot (see become_fetcher)
+_fetching = not SHARED_SNAPSHOT
+_MARKERS = f"{SHARED_SNAPSHOT}.demand" if SHARED_SNAPSHOT else ""
+# Seconds between marker file updates for the same pair
+_MARKER_INTERVAL = 5.0
+_marked = {}
+
+
+def make_pair(fiat, pay_filter=(), asset=ASSET):
+    """Pair dict for ``asset``/``fiat``: the configured one if there is one and no filter is given."""
+    fiat, asset = fiat.upper(), asset.upper()
+    key = asset_key(asset, fiat)
+    if not pay_filter and key in _CONFIGURED:
+        return _CONFIGURED[key]
+    pay_filter = sorted(set(pay_filter))
+    return {
+        "asset": asset,
+        "fiat": fiat,
+        "label": f"{asset}/{fiat}",
+        "pay_filter": pay_filter,
+        "key": f"{key}:{','.join(pay_filter)}" if pay_filter else key,
+    }
+
+
+def _valid(pair):
+    fiat, asset = pair["fiat"], pair.get("asset", ASSET)
+    return (fiat.isascii() and fiat.isalpha() and 2 <= len(fiat) <= 5
+            and asset.isascii() and asset.isalnum() and 2 <= len(asset) <= 10)
+
+
+def _age(data):
+    """Seconds since a fiat's data was refreshed, or None if it never was."""
+    stamp = data.get("last_refresh")
+    if not stamp:
+        return None
+    refreshed = datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TZ_OFFSET)
+    return time.time() - refreshed.timestamp()
+
+
+def _refresh(pair):
+    key = pair_key(pair)
+    try:
+        data = fetch_all_pairs([pair])
+        snap = snapshot.publish(data)
+        history.record(data)
+        print(f"[{key}] Fetched on demand (v{snap.version})")
+    except Exception as e:
+        print(f"[{key}] Error fetching on demand: {e}")
+
+
+def revalidate(pair):
+    """Start fetching ``pair`` unless a fetch for it is already running. Returns its future."""
+    key = pair_key(pair)
+    with _lock:
+        future = _fetches.get(key)
+        if future is None or future.done():
+            future = _fetches[key] = _executor.submit(_refresh, pair)
+    return future
+
+
+def request(fiat, pay_filter=(), asset=ASSET):
+    """Register demand for an asset/fiat pair and make sure its data is (being) fetched.
+
+    Returns the pair key to look up in the snapshot. Waits only when
+    there is no data for the pair yet.
+    """
+    pair = make_pair(fiat, pay_filter, asset)
+    key = pair_key(pair)
+    if not _valid(pair):
+        return key
+    now = time.time()
+    with _lock:
+        previous = _demand.get(key)
+        if previous is None and len(_demand) >= DEMAND["max_pairs"]:
+            return key
+        _demand[key] = {"pair": pair, "requested": now}
+    if not _fetching:
+        _mark(pair, now)
+    data = snapshot.current().price_data.get(key)
+    age = _age(data) if data else None
+    if age is None:
+        if _fetching:
+            wait([revalidate(pair)], timeout=DEMAND["wait"])
+        else:
+            _wait_for(key, now + DEMAND["wait"])
+    # The rotation's interval can exceed the TTL (adaptive mode), so data
+    # past it is always revalidated; running fetches are shared, not repeated
+    elif _fetching and age > DEMAND["ttl"]:
+        revalidate(pair)
+    return key
+
+
+def _wait_for(key, deadline):
+    """Wait until the fetching worker publishes ``key`` (shared snapshot followers)."""
+    snap = snapshot.current()
+    while _age(snap.price_data.get(key, {})) is None and time.time() < deadline:
+        snap = snapshot.wait_for_update(snap.version, timeout=deadline - time.time())
+
+
+def _marker_path(pair):
+    name = json.dumps([pair["fiat"], pair.get("pay_filter", []), pair.get("asset", ASSET)]).encode()
+    return os.path.join(_MARKERS, base64.urlsafe_b64encode(name).decode())
+
+
+def _mark(pair, now):
+    """Record demand where the fetching worker will see it."""
+    key = pair_key(pair)
+    if now - _marked.get(key, 0.0) < _MARKER_INTERVAL:
+        return
+    if len(_marked) >= DEMAND["max_pairs"]:
+        # Followers never rotate; entries past the interval no longer matter
+        for marked, at in list(_marked.items()):
+            if now - at >= _MARKER_INTERVAL:
+                del _marked[marked]
+    _marked[key] = now
+    path = _marker_path(pair)
+    try:
+        os.makedirs(_MARKERS, exist_ok=True)
+        with open(path, "a"):
+            pass
+        os.utime(path, (now, now))
+    except OSError as e:
+        print(f"[demand] Could not record demand in {_MARKERS}: {e}")
+
+
+def _read_markers():
+    try:
+        names = os.listdir(_MARKERS)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(_MARKERS, name)
+        try:
+            fiat, pay_filter, asset = json.loads(base64.urlsafe_b64decode(name))
+            requested = os.stat(path).st_mtime
+        except (OSError, ValueError):
+            continue
+        pair = make_pair(fiat, pay_filter, asset)
+        key = pair_key(pair)
+        with _lock:
+            entry = _demand.get(key)
+            if entry is None and len(_demand) < DEMAND["max_pairs"]:
+                _demand[key] = {"pair": pair, "requested": requested}
+            elif entry is not None and requested > entry["requested"]:
+                entry["requested"] = requested
+
+
+def become_fetcher():
+    """Called in the worker that won the fetcher election: act on other workers' demand too."""
+    global _fetching
+    _fetching = True
+
+
+def rotation(now=None):
+    """Pairs to keep refreshing, and keys to drop from the snapshot.
+
+    Returns (pairs requested within DEMAND["idle"] seconds, on-demand keys
+    idle for DEMAND["evict"] seconds). Evicted keys are forgotten, along
+    with everything the fetcher cached for them.
+    """
+    now = time.time() if now is None else now
+    if _MARKERS:
+        _read_markers()
+    pairs, evicted = [], []
+    with _lock:
+        for key, entry in list(_demand.items()):
+            idle = now - entry["requested"]
+            if idle <= DEMAND["idle"]:
+                pairs.append(entry["pair"])
+            elif idle > DEMAND["evict"] and key not in _CONFIGURED:
+                del _demand[key]
+                evicted.append(entry["pair"])
+    for pair in evicted:
+        _fetches.pop(pair_key(pair), None)
+        _marked.pop(pair_key(pair), None)
+        forget_pair(pair)
+        if _MARKERS:
+            try:
+                os.remove(_marker_path(pair))
+            except OSError:
+                pass
+    return pairs, [pair_key(pair) for pair in evicted]
+
+
+# Configured pairs count as requested at startup, so the dashboard's first load is warm
+for _pair in PAIRS:
+    _demand[pair_key(_pair)] = {"pair": _pair, "requested": time.time()}
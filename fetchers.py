@@ -1,10 +1,20 @@
 """P2P price fetchers for Binance, Bybit, OKX, and MEXC."""
 
+import functools
 import json
+import threading
 import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone, timedelta
-import requests
-from config import ASSET, PAGE_SIZE, MAX_PAGES, PAIRS
+import catalog
+import metrics
+import transport
+from adbook import AdBook, add_live_source, books_in
+from config import (
+    ASSET, PAGE_SIZE, MAX_PAGES, PAIRS,
+    EXCHANGE_CONCURRENCY, CYCLE_DEADLINE, PAGINATION,
+)
 
 TZ_OFFSET = timezone(timedelta(hours=3))
 
@@ -28,30 +38,8 @@ MEXC_COIN_IDS = {
     "USDC": "34309140878b4ae99f195ac091d49bab",
 }
 
-# MEXC payment method ID -> name mapping (loaded on first fetch)
-MEXC_PAYMENT_METHODS = {}
-
-# Bybit payment ID -> name mapping
-BYBIT_PAYMENT_NAMES = {
-    "629": "CBE", "630": "Tele Birr", "631": "Awash Bank",
-    "632": "Bank of Abyssinia", "633": "Dashen Bank", "634": "Wegagen Bank",
-    "635": "Hibret Bank", "636": "Nib Bank", "637": "Oromia Bank",
-    "638": "Ebirr", "639": "Amole", "6": "Bank Transfer",
-    "14": "Bank Transfer", "40": "Mobile Money", "41": "Mobile Money",
-    "97": "Mobile Money", "178": "Bank Transfer",
-    "582": "Payoneer", "62": "Payoneer",
-}
-
-# Payment method name mappings per exchange (generic name -> exchange-specific identifier)
-BINANCE_PAY_METHODS = {
-    "Dukascopy": "DukascopyBank",
-    "Payoneer": "Payoneer",
-}
-
-OKX_PAY_METHODS = {
-    "Dukascopy": "Dukascopy",
-    "Payoneer": "Payoneer",
-}
+# Payment method ids and names per exchange are mapped to canonical ids in
+# catalog.py; ads carry the canonical ids.
 
 
 def _safe_float(value, default=0.0):
@@ -61,38 +49,110 @@ def _safe_float(value, default=0.0):
         return default
 
 
+def _fetch_page(request, exchange, side, page, url, parse, **kwargs):
+    """Send one page request (transport.get_json/post_json), timing it per exchange/side/page.
+
+    ``parse(data)`` turns the page into (AdBook, items on the page). A page
+    byte-identical to one seen before reuses its parsed book (see
+    transport.request_json), so those books must never be modified.
+    """
+    with metrics.PAGE_SECONDS.time(exchange, side, str(page)):
+        return request(exchange, url, parse=parse, **kwargs)
+
+
 def _build_result(exchange, buy_ads, sell_ads):
-    """Build a standardized result dict from raw ad lists."""
-    sell_prices = [a["price"] for a in sell_ads if a["price"] > 0]
-    best_sell = max(sell_prices) if sell_prices else None
+    """Build a standardized result dict from the two sides' AdBooks."""
+    sell_count, _, best_sell, avg_sell = sell_ads.price_stats()
 
     # Filter out ineligible buy ads: if a buy price <= best sell price,
-    # the ad can't actually be traded (would be free arbitrage).
-    if best_sell is not None:
-        buy_ads = [a for a in buy_ads if a["price"] > best_sell]
+    # the ad can't actually be traded (would be free arbitrage). They are
+    # kept aside as crossed_buy_ads for the arbitrage scanner to report.
+    crossed_ads = AdBook()
+    if best_sell is not None and buy_ads and min(buy_ads.price) <= best_sell:
+        crossed_ads = buy_ads.select([i for i, p in enumerate(buy_ads.price) if p <= best_sell])
+        buy_ads = buy_ads.select([i for i, p in enumerate(buy_ads.price) if p > best_sell])
 
-    buy_prices = [a["price"] for a in buy_ads if a["price"] > 0]
+    buy_count, best_buy, _, avg_buy = buy_ads.price_stats()
 
     return {
         "exchange": exchange,
         "buy_ads": buy_ads,
         "sell_ads": sell_ads,
-        "best_buy_price": min(buy_prices) if buy_prices else None,
+        "crossed_buy_ads": crossed_ads,
+        "best_buy_price": best_buy,
         "best_sell_price": best_sell,
-        "avg_buy_price": round(sum(buy_prices) / len(buy_prices), 2) if buy_prices else None,
-        "avg_sell_price": round(sum(sell_prices) / len(sell_prices), 2) if sell_prices else None,
-        "buy_count": len(buy_prices),
-        "sell_count": len(sell_prices),
+        "avg_buy_price": round(avg_buy, 2) if buy_count else None,
+        "avg_sell_price": round(avg_sell, 2) if sell_count else None,
+        "buy_count": buy_count,
+        "sell_count": sell_count,
         "last_updated": _now(),
         "error": None,
+        "stale": False,
+        "stale_reason": None,
     }
 
 
+def _ads_changed(old, new):
+    """Ads in one book and not the other, by fingerprint (0 for equal books)."""
+    if old == new:
+        return 0
+    old_ads, new_ads = Counter(old.fingerprints()), Counter(new.fingerprints())
+    return (old_ads - new_ads).total() + (new_ads - old_ads).total()
+
+
+def build_result(key, exchange, buy_ads, sell_ads, truncated=()):
+    """_build_result for pair ``key``, reusing the previous result if no ad changed.
+
+    A reused result keeps its AdBooks, and with them their encoded JSON;
+    only last_updated is new. Sides in ``truncated`` were fetched under a
+    pagination policy (see _depth_policy): their averages and counts are
+    the last full-depth fetch's, so they don't jump with every full sweep.
+    """
+    previous = _built.get((key, exchange))
+    if previous is not None:
+        old_buy, old_sell, result = previous
+        changed_buy, changed_sell = _ads_changed(old_buy, buy_ads), _ads_changed(old_sell, sell_ads)
+        metrics.ADS_CHANGED.inc(exchange, "buy", amount=changed_buy)
+        metrics.ADS_CHANGED.inc(exchange, "sell", amount=changed_sell)
+        if not (changed_buy or changed_sell):
+            metrics.RESULTS_UNCHANGED.inc(exchange)
+            return _full_depth_stats(key, {**result, "last_updated": _now()}, truncated)
+    result = _build_result(exchange, buy_ads, sell_ads)
+    _built[(key, exchange)] = (buy_ads, sell_ads, result)
+    return _full_depth_stats(key, result, truncated)
+
+
+def _full_depth_stats(key, result, truncated):
+    """``result`` with truncated sides' average and count from the last full-depth fetch.
+
+    Full-depth sides record theirs. A truncated side with no full fetch
+    yet keeps its own.
+    """
+    for side in ("buy", "sell"):
+        fields = (f"avg_{side}_price", f"{side}_count")
+        if side not in truncated:
+            _full_stats[(key, result["exchange"], side)] = tuple(result[f] for f in fields)
+            continue
+        stats = _full_stats.get((key, result["exchange"], side))
+        if stats is not None:
+            result = {**result, **dict(zip(fields, stats))}
+    return result
+
+
+def truncated_sides(buy_future, sell_future):
+    """Sides whose fetch (see _submit_side) ran under a pagination policy."""
+    return tuple(
+        side for side, future in (("buy", buy_future), ("sell", sell_future))
+        if getattr(future, "truncated", False)
+    )
+
+
 def _error_result(exchange, error_msg):
     return {
         "exchange": exchange,
-        "buy_ads": [],
-        "sell_ads": [],
+        "buy_ads": AdBook(),
+        "sell_ads": AdBook(),
+        "crossed_buy_ads": AdBook(),
         "best_buy_price": None,
         "best_sell_price": None,
         "avg_buy_price": None,
@@ -101,353 +161,396 @@ def _error_result(exchange, error_msg):
         "sell_count": 0,
         "last_updated": _now(),
         "error": str(error_msg),
+        "stale": False,
+        "stale_reason": None,
     }
 
 
+def stale_result(last_good, exchange, reason):
+    """``last_good`` marked stale with ``reason``, or an error result if there is none."""
+    if last_good is None:
+        return _error_result(exchange, reason)
+    return {**last_good, "stale": True, "stale_reason": str(reason)}
+
+
+def asset_key(asset, fiat):
+    """Snapshot key of (asset, fiat): the fiat for ASSET, "ASSET/FIAT" for any other asset."""
+    return fiat if asset == ASSET else f"{asset}/{fiat}"
+
+
+def pair_key(pair):
+    """Snapshot key of a pair (see asset_key), with ":method,method" for an on-demand filtered pair."""
+    return pair.get("key") or asset_key(pair.get("asset", ASSET), pair["fiat"])
+
+
+def _depth_policy(pair, side, cycle):
+    """Pagination policy for one side of a pair, or None for a full-depth sweep.
+
+    Starts from config.PAGINATION, then the pair's own "pagination" dict,
+    then that dict's "buy"/"sell" entry. A liquidity_target given per asset
+    is resolved to the pair's asset.
+    """
+    overrides = pair.get("pagination") or {}
+    policy = {**PAGINATION, **{k: v for k, v in overrides.items() if k not in ("buy", "sell")}}
+    policy.update(overrides.get(side) or {})
+    target = policy.get("liquidity_target")
+    if isinstance(target, dict):
+        policy["liquidity_target"] = target.get(pair.get("asset", ASSET))
+    every = policy.get("full_depth_every") or 0
+    if every <= 1 or cycle % every == 0:
+        return None
+    return policy
+
+
+def _depth_reached(ads, depth):
+    """True once the ads fetched so far satisfy the pagination policy.
+
+    Ads come back best price first, so the band is measured from the first ad.
+    """
+    if depth is None or not ads:
+        return False
+    best = ads.price[0]
+    band = depth.get("price_band_pct")
+    if band is not None and best > 0 and abs(ads.price[-1] - best) / best * 100 > band:
+        return True
+    target = depth.get("liquidity_target")
+    return bool(target) and sum(ads.available) >= target
+
+
+def _fetch_both_sides(exchange, side_fetcher, fiat, pay_filter):
+    """Fetch buy and sell sides in turn and build the exchange result."""
+    pay_filter = pay_filter or []
+    try:
+        buy_ads = side_fetcher(fiat, pay_filter, "buy")
+        sell_ads = side_fetcher(fiat, pay_filter, "sell")
+        return _build_result(exchange, buy_ads, sell_ads)
+    except Exception as e:
+        return _error_result(exchange, e)
+
+
 # ---------------------------------------------------------------------------
 # MEXC
 # ---------------------------------------------------------------------------
-def _load_mexc_payment_methods():
-    """Load MEXC payment method names once."""
-    global MEXC_PAYMENT_METHODS
-    if MEXC_PAYMENT_METHODS:
-        return
-    try:
-        resp = requests.get(
-            "https://www.mexc.com/api/platform/p2p/api/payment/method",
-            headers={**HEADERS, "Referer": "https://www.mexc.com/buy-crypto/p2p"},
-            timeout=10,
+def _fetch_mexc_payment_methods():
+    """MEXC payment method id -> name (cached by catalog.py)."""
+    data = transport.get_json(
+        "MEXC",
+        "https://www.mexc.com/api/platform/p2p/api/payment/method",
+        headers={**HEADERS, "Referer": "https://www.mexc.com/buy-crypto/p2p"},
+        timeout=10,
+    )
+    if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+        raise ValueError("unexpected payment method response")
+    methods = {}
+    for pm in data["data"]:
+        if isinstance(pm, dict):
+            pm_id = str(pm.get("id", ""))
+            methods[pm_id] = pm.get("nameEn") or pm.get("name") or pm.get("nameCn") or pm_id
+    return methods
+
+
+catalog.register_source("MEXC", _fetch_mexc_payment_methods)
+
+
+def _mexc_pay_ids(pay_filter):
+    """MEXC payment method ids for the filter names: by canonical id, else
+    every MEXC method whose name contains the filter name."""
+    ids = []
+    table = catalog.EXCHANGE_IDS["MEXC"]
+    for method in pay_filter or ():
+        known = catalog.exchange_ids("MEXC", [method], fallback=False)
+        if not known:
+            needle = method.lower()
+            known = [
+                pid for pid, cid in table.items()
+                if needle in catalog.name(cid).lower()
+            ]
+        ids.extend(known)
+    return list(dict.fromkeys(ids))
+
+
+def _fetch_mexc_side(fiat, pay_filter, side, depth=None, asset=ASSET):
+    """Fetch one side ("buy" or "sell") of the MEXC book."""
+    catalog.ensure_loaded()
+
+    coin_id = MEXC_COIN_IDS.get(asset)
+    if coin_id is None:
+        raise ValueError(f"No MEXC coin id for {asset}")
+    base_url = "https://www.mexc.com/api/platform/p2p/api/market"
+    pay_ids = _mexc_pay_ids(pay_filter)
+    if pay_filter and not pay_ids:
+        # An empty payMethod would return the whole unfiltered book
+        print(f"[MEXC] No payment method matches {', '.join(pay_filter)}; skipping {side} side")
+        return AdBook()
+    pay_method_param = ",".join(pay_ids)
+
+    # MEXC tradeType is from maker perspective: BUY = maker buying = we sell
+    trade_type = "BUY" if side == "sell" else "SELL"
+    mexc_page_size = 10  # MEXC returns 10 items per page
+    mexc_max_pages = 5   # Cap at 5 pages (50 ads)
+    params = {
+        "adsType": "0",
+        "allowTrade": "true",
+        "amount": "",
+        "blockTrade": "false",
+        "certifiedMerchant": "false",
+        "coinId": coin_id,
+        "countryCode": "",
+        "currency": fiat,
+        "follow": "false",
+        "haveTrade": "false",
+        "page": "1",
+        "payMethod": pay_method_param,
+        "tradeType": trade_type,
+    }
+
+    ads_list = AdBook()
+    for page_num in range(1, mexc_max_pages + 1):
+        params["page"] = str(page_num)
+        page, count = _fetch_page(
+            transport.get_json, "MEXC", side, page_num, base_url, _parse_mexc_page,
+            params=params, headers={**HEADERS, "Referer": "https://www.mexc.com/buy-crypto/p2p"},
+            timeout=15,
         )
-        data = resp.json()
-        if isinstance(data, dict) and "data" in data:
-            for pm in data["data"]:
-                if isinstance(pm, dict):
-                    pm_id = str(pm.get("id", ""))
-                    pm_name = pm.get("nameEn") or pm.get("name") or pm.get("nameCn") or pm_id
-                    MEXC_PAYMENT_METHODS[pm_id] = pm_name
-            print(f"[MEXC] Loaded {len(MEXC_PAYMENT_METHODS)} payment methods")
-    except Exception as e:
-        print(f"[MEXC] Payment method load error: {e}")
+        if not count:
+            break
+        ads_list.extend(page)
 
+        if count < mexc_page_size or _depth_reached(ads_list, depth):
+            break
 
-def _mexc_pay_filter_ids(pay_filter):
-    """Find MEXC payment method IDs matching filter names."""
-    if not pay_filter or not MEXC_PAYMENT_METHODS:
-        return ""
-    matching_ids = []
-    for pm_id, pm_name in MEXC_PAYMENT_METHODS.items():
-        for f in pay_filter:
-            if f.lower() in pm_name.lower():
-                matching_ids.append(pm_id)
-                break
-    return ",".join(matching_ids)
+    return ads_list
 
 
-def fetch_mexc(fiat="ETB", pay_filter=None):
-    """Fetch P2P ads from MEXC."""
-    exchange = "MEXC"
-    pay_filter = pay_filter or []
+def _parse_mexc_page(data):
+    raw_items = data.get("data", []) if isinstance(data, dict) else []
+    page = AdBook()
+    for item in raw_items:
+        price = _safe_float(item.get("price"))
+        amount = _safe_float(item.get("availableQuantity"))
+        min_amount = _safe_float(item.get("minTradeLimit"))
+        max_amount = _safe_float(item.get("maxTradeLimit"))
 
-    try:
-        _load_mexc_payment_methods()
-
-        coin_id = MEXC_COIN_IDS.get(ASSET, MEXC_COIN_IDS["USDT"])
-        base_url = "https://www.mexc.com/api/platform/p2p/api/market"
-        all_ads = {"buy": [], "sell": []}
-        pay_method_param = _mexc_pay_filter_ids(pay_filter)
-
-        # MEXC tradeType is from maker perspective: BUY = maker buying = we sell
-        mexc_page_size = 10  # MEXC returns 10 items per page
-        mexc_max_pages = 5   # Cap at 5 pages (50 ads)
-        for trade_type, side_name in [("BUY", "sell"), ("SELL", "buy")]:
-            params = {
-                "adsType": "0",
-                "allowTrade": "true",
-                "amount": "",
-                "blockTrade": "false",
-                "certifiedMerchant": "false",
-                "coinId": coin_id,
-                "countryCode": "",
-                "currency": fiat,
-                "follow": "false",
-                "haveTrade": "false",
-                "page": "1",
-                "payMethod": pay_method_param,
-                "tradeType": trade_type,
-            }
-
-            ads_list = []
-            for page_num in range(1, mexc_max_pages + 1):
-                params["page"] = str(page_num)
-                resp = requests.get(base_url, params=params, headers={
-                    **HEADERS,
-                    "Referer": "https://www.mexc.com/buy-crypto/p2p",
-                }, timeout=15)
-                data = resp.json()
-
-                raw_items = data.get("data", []) if isinstance(data, dict) else []
-                if not raw_items:
-                    break
-
-                for item in raw_items:
-                    price = _safe_float(item.get("price"))
-                    amount = _safe_float(item.get("availableQuantity"))
-                    min_amount = _safe_float(item.get("minTradeLimit"))
-                    max_amount = _safe_float(item.get("maxTradeLimit"))
-
-                    merchant_info = item.get("merchant", {})
-                    merchant = merchant_info.get("nickName", "Unknown") if isinstance(merchant_info, dict) else "Unknown"
-
-                    pay_ids = str(item.get("payMethod", "")).split(",")
-                    payments = [
-                        MEXC_PAYMENT_METHODS.get(pid.strip(), f"Method {pid.strip()}")
-                        for pid in pay_ids if pid.strip()
-                    ]
-
-                    ads_list.append({
-                        "price": price,
-                        "available_amount": amount,
-                        "min_amount": min_amount,
-                        "max_amount": max_amount,
-                        "merchant": merchant,
-                        "payment_methods": payments,
-                    })
-
-                if len(raw_items) < mexc_page_size:
-                    break
-
-            all_ads[side_name] = ads_list
-
-        return _build_result(exchange, all_ads["buy"], all_ads["sell"])
+        merchant_info = item.get("merchant", {})
+        merchant = merchant_info.get("nickName", "Unknown") if isinstance(merchant_info, dict) else "Unknown"
 
-    except Exception as e:
-        return _error_result(exchange, e)
+        pay_ids = str(item.get("payMethod", "")).split(",")
+        payments = [catalog.from_exchange("MEXC", pid) for pid in pay_ids if pid.strip()]
+
+        page.append(price, amount, min_amount, max_amount, merchant, payments)
+    return page, len(raw_items)
+
+
+def fetch_mexc(fiat="ETB", pay_filter=None):
+    """Fetch P2P ads from MEXC."""
+    return _fetch_both_sides("MEXC", _fetch_mexc_side, fiat, pay_filter)
 
 
 # ---------------------------------------------------------------------------
 # Binance
 # ---------------------------------------------------------------------------
-def fetch_binance(fiat="ETB", pay_filter=None):
-    """Fetch P2P ads from Binance."""
+def _fetch_binance_side(fiat, pay_filter, side, depth=None, asset=ASSET):
+    """Fetch one side ("buy" or "sell") of the Binance book."""
     url = "https://p2p.binance.com/bapi/c2c/v2/friendly/c2c/adv/search"
-    exchange = "Binance"
-    pay_filter = pay_filter or []
 
     # Map generic names to Binance-specific identifiers
-    pay_types = [BINANCE_PAY_METHODS.get(p, p) for p in pay_filter] if pay_filter else []
+    pay_types = catalog.exchange_ids("Binance", pay_filter)
+
+    payload = {
+        "fiat": fiat,
+        "page": 1,
+        "rows": PAGE_SIZE,
+        "tradeType": side.upper(),
+        "asset": asset,
+        "countries": [],
+        "proMerchantAds": False,
+        "shieldMerchantAds": False,
+        "publisherType": None,
+        "payTypes": pay_types,
+        "classifies": ["mass", "profession"],
+    }
 
-    try:
-        all_ads = {"buy": [], "sell": []}
-
-        for trade_type in ["BUY", "SELL"]:
-            payload = {
-                "fiat": fiat,
-                "page": 1,
-                "rows": PAGE_SIZE,
-                "tradeType": trade_type,
-                "asset": ASSET,
-                "countries": [],
-                "proMerchantAds": False,
-                "shieldMerchantAds": False,
-                "publisherType": None,
-                "payTypes": pay_types,
-                "classifies": ["mass", "profession"],
-            }
-
-            ads_list = []
-            for page_num in range(1, MAX_PAGES + 1):
-                payload["page"] = page_num
-                resp = requests.post(url, json=payload, headers=HEADERS, timeout=15)
-                data = resp.json()
-                page_items = data.get("data", [])
-                if not page_items:
-                    break
-
-                for item in page_items:
-                    adv = item.get("adv", {})
-                    advertiser = item.get("advertiser", {})
-                    price = _safe_float(adv.get("price"))
-                    amount = _safe_float(adv.get("surplusAmount") or adv.get("tradableQuantity"))
-                    min_amount = _safe_float(adv.get("minSingleTransAmount"))
-                    max_amount = _safe_float(adv.get("maxSingleTransAmount"))
-                    merchant = advertiser.get("nickName", "Unknown")
-                    payments = [
-                        m.get("tradeMethodName", m.get("identifier", ""))
-                        for m in adv.get("tradeMethods", [])
-                    ]
-
-                    ads_list.append({
-                        "price": price,
-                        "available_amount": amount,
-                        "min_amount": min_amount,
-                        "max_amount": max_amount,
-                        "merchant": merchant,
-                        "payment_methods": payments,
-                    })
-
-                if len(page_items) < PAGE_SIZE:
-                    break
-
-            side = "buy" if trade_type == "BUY" else "sell"
-            all_ads[side] = ads_list
-
-        return _build_result(exchange, all_ads["buy"], all_ads["sell"])
+    ads_list = AdBook()
+    for page_num in range(1, MAX_PAGES + 1):
+        payload["page"] = page_num
+        page, count = _fetch_page(
+            transport.post_json, "Binance", side, page_num, url, _parse_binance_page,
+            json=payload, headers=HEADERS, timeout=15,
+        )
+        if not count:
+            break
+        ads_list.extend(page)
 
-    except Exception as e:
-        return _error_result(exchange, e)
+        if count < PAGE_SIZE or _depth_reached(ads_list, depth):
+            break
+
+    return ads_list
+
+
+def _parse_binance_page(data):
+    page_items = data.get("data") or []
+    page = AdBook()
+    for item in page_items:
+        adv = item.get("adv", {})
+        advertiser = item.get("advertiser", {})
+        price = _safe_float(adv.get("price"))
+        amount = _safe_float(adv.get("surplusAmount") or adv.get("tradableQuantity"))
+        min_amount = _safe_float(adv.get("minSingleTransAmount"))
+        max_amount = _safe_float(adv.get("maxSingleTransAmount"))
+        merchant = advertiser.get("nickName", "Unknown")
+        payments = [
+            catalog.from_exchange("Binance", m.get("tradeMethodName") or m.get("identifier", ""))
+            for m in adv.get("tradeMethods", [])
+        ]
+
+        page.append(price, amount, min_amount, max_amount, merchant, payments)
+    return page, len(page_items)
+
+
+def fetch_binance(fiat="ETB", pay_filter=None):
+    """Fetch P2P ads from Binance."""
+    return _fetch_both_sides("Binance", _fetch_binance_side, fiat, pay_filter)
 
 
 # ---------------------------------------------------------------------------
 # Bybit
 # ---------------------------------------------------------------------------
-def fetch_bybit(fiat="ETB", pay_filter=None):
-    """Fetch P2P ads from Bybit."""
+def _fetch_bybit_side(fiat, pay_filter, side, depth=None, asset=ASSET):
+    """Fetch one side ("buy" or "sell") of the Bybit book."""
     url = "https://api2.bybit.com/fiat/otc/item/online"
-    exchange = "Bybit"
-    pay_filter = pay_filter or []
 
-    try:
-        all_ads = {"buy": [], "sell": []}
-
-        for side_code, side_name in [("1", "buy"), ("0", "sell")]:
-            payload = {
-                "userId": "",
-                "tokenId": ASSET,
-                "currencyId": fiat,
-                "payment": pay_filter if pay_filter else [],
-                "side": side_code,
-                "size": str(PAGE_SIZE),
-                "page": "1",
-                "amount": "",
-                "authMaker": False,
-                "canTrade": True,
-            }
-
-            ads_list = []
-            for page_num in range(1, MAX_PAGES + 1):
-                payload["page"] = str(page_num)
-                resp = requests.post(url, json=payload, headers=HEADERS, timeout=15)
-                data = resp.json()
-
-                raw_items = (data.get("result") or {}).get("items") or []
-                # Skip ads where merchant requires taker to have posted their own ad
-                # (these show as "ineligible" for most users on Bybit)
-                items = [
-                    i for i in raw_items
-                    if not (i.get("tradingPreferenceSet") or {}).get("hasUnPostAd")
-                ]
-                if not raw_items:
-                    break
-
-                for item in items:
-                    price = _safe_float(item.get("price"))
-                    amount = _safe_float(item.get("lastQuantity") or item.get("quantity"))
-                    min_amount = _safe_float(item.get("minAmount"))
-                    max_amount = _safe_float(item.get("maxAmount"))
-                    merchant = item.get("nickName", "Unknown")
-
-                    raw_payments = item.get("payments", [])
-                    payments = []
-                    for p in raw_payments:
-                        if isinstance(p, dict):
-                            payments.append(p.get("paymentName", p.get("paymentType", str(p))))
-                        else:
-                            pid = str(p)
-                            payments.append(BYBIT_PAYMENT_NAMES.get(pid, f"Method {pid}"))
-
-                    ads_list.append({
-                        "price": price,
-                        "available_amount": amount,
-                        "min_amount": min_amount,
-                        "max_amount": max_amount,
-                        "merchant": merchant,
-                        "payment_methods": payments,
-                    })
-
-                if len(raw_items) < PAGE_SIZE:
-                    break
-
-            all_ads[side_name] = ads_list
-
-        return _build_result(exchange, all_ads["buy"], all_ads["sell"])
+    payload = {
+        "userId": "",
+        "tokenId": asset,
+        "currencyId": fiat,
+        "payment": catalog.exchange_ids("Bybit", pay_filter),
+        "side": "1" if side == "buy" else "0",
+        "size": str(PAGE_SIZE),
+        "page": "1",
+        "amount": "",
+        "authMaker": False,
+        "canTrade": True,
+    }
 
-    except Exception as e:
-        return _error_result(exchange, e)
+    ads_list = AdBook()
+    for page_num in range(1, MAX_PAGES + 1):
+        payload["page"] = str(page_num)
+        page, count = _fetch_page(
+            transport.post_json, "Bybit", side, page_num, url, _parse_bybit_page,
+            json=payload, headers=HEADERS, timeout=15,
+        )
+        if not count:
+            break
+        ads_list.extend(page)
+
+        if count < PAGE_SIZE or _depth_reached(ads_list, depth):
+            break
+
+    return ads_list
+
+
+def _parse_bybit_page(data):
+    raw_items = (data.get("result") or {}).get("items") or []
+    page = AdBook()
+    for item in raw_items:
+        # Skip ads where merchant requires taker to have posted their own ad
+        # (these show as "ineligible" for most users on Bybit)
+        if (item.get("tradingPreferenceSet") or {}).get("hasUnPostAd"):
+            continue
+        price = _safe_float(item.get("price"))
+        amount = _safe_float(item.get("lastQuantity") or item.get("quantity"))
+        min_amount = _safe_float(item.get("minAmount"))
+        max_amount = _safe_float(item.get("maxAmount"))
+        merchant = item.get("nickName", "Unknown")
+
+        raw_payments = item.get("payments", [])
+        payments = []
+        for p in raw_payments:
+            if isinstance(p, dict):
+                p = p.get("paymentName", p.get("paymentType", str(p)))
+            payments.append(catalog.from_exchange("Bybit", p))
+
+        page.append(price, amount, min_amount, max_amount, merchant, payments)
+    # Skipped ads still count toward the page size
+    return page, len(raw_items)
+
+
+def fetch_bybit(fiat="ETB", pay_filter=None):
+    """Fetch P2P ads from Bybit."""
+    return _fetch_both_sides("Bybit", _fetch_bybit_side, fiat, pay_filter)
 
 
 # ---------------------------------------------------------------------------
 # OKX
 # ---------------------------------------------------------------------------
-def fetch_okx(fiat="ETB", pay_filter=None):
-    """Fetch P2P ads from OKX."""
+def _fetch_okx_side(fiat, pay_filter, side, depth=None, asset=ASSET):
+    """Fetch one side ("buy" or "sell") of the OKX book.
+
+    OKX returns the whole book in one response, so ``depth`` is unused.
+    """
     base_url = "https://www.okx.com/v3/c2c/tradingOrders/books"
-    exchange = "OKX"
-    pay_filter = pay_filter or []
 
     # OKX paymentMethod param: comma-separated or "all"
-    pay_method_param = ",".join(
-        OKX_PAY_METHODS.get(p, p) for p in pay_filter
-    ) if pay_filter else "all"
+    pay_method_param = ",".join(catalog.exchange_ids("OKX", pay_filter)) or "all"
+
+    # OKX side is from maker's perspective: "buy" = makers buying YOUR usdt
+    maker_side = "buy" if side == "sell" else "sell"
+    params = {
+        "quoteCurrency": fiat.lower(),
+        "baseCurrency": asset.lower(),
+        "side": maker_side,
+        "paymentMethod": pay_method_param,
+        "userType": "all",
+        "showTrade": "false",
+        "showFollow": "false",
+        "showAlreadyTraded": "false",
+        "isAbleFilter": "true",
+        "receivingAds": "false",
+    }
 
-    try:
-        all_ads = {"buy": [], "sell": []}
-
-        for side in ["buy", "sell"]:
-            params = {
-                "quoteCurrency": fiat.lower(),
-                "baseCurrency": ASSET.lower(),
-                "side": side,
-                "paymentMethod": pay_method_param,
-                "userType": "all",
-                "showTrade": "false",
-                "showFollow": "false",
-                "showAlreadyTraded": "false",
-                "isAbleFilter": "true",
-                "receivingAds": "false",
-            }
-
-            get_headers = {
-                "User-Agent": HEADERS["User-Agent"],
-                "Accept": "application/json",
-            }
-
-            resp = requests.get(base_url, params=params, headers=get_headers, timeout=15)
-            data = resp.json()
-
-            ads_list = []
-            items = data.get("data", {}).get(side, [])
-
-            for item in items:
-                price = _safe_float(item.get("price"))
-                amount = _safe_float(item.get("availableAmount"))
-                min_amount = _safe_float(item.get("quoteMinAmountPerOrder"))
-                max_amount = _safe_float(item.get("quoteMaxAmountPerOrder"))
-                merchant = item.get("nickName", "Unknown")
-
-                payments = []
-                for p in item.get("paymentMethods", []):
-                    if isinstance(p, str):
-                        payments.append(p)
-                    elif isinstance(p, dict):
-                        payments.append(p.get("paymentMethod", ""))
-
-                ads_list.append({
-                    "price": price,
-                    "available_amount": amount,
-                    "min_amount": min_amount,
-                    "max_amount": max_amount,
-                    "merchant": merchant,
-                    "payment_methods": payments,
-                })
-
-            # OKX side is from maker's perspective: "buy" = makers buying YOUR usdt
-            mapped_side = "sell" if side == "buy" else "buy"
-            all_ads[mapped_side] = ads_list
-
-        return _build_result(exchange, all_ads["buy"], all_ads["sell"])
+    get_headers = {
+        "User-Agent": HEADERS["User-Agent"],
+        "Accept": "application/json",
+    }
 
-    except Exception as e:
-        return _error_result(exchange, e)
+    page, _ = _fetch_page(
+        transport.get_json, "OKX", side, 1, base_url, _OKX_PARSERS[maker_side],
+        params=params, headers=get_headers, timeout=15,
+    )
+
+    ads_list = AdBook()
+    ads_list.extend(page)
+    return ads_list
+
+
+def _parse_okx_page(maker_side, data):
+    items = data.get("data", {}).get(maker_side, [])
+    page = AdBook()
+    for item in items:
+        price = _safe_float(item.get("price"))
+        amount = _safe_float(item.get("availableAmount"))
+        min_amount = _safe_float(item.get("quoteMinAmountPerOrder"))
+        max_amount = _safe_float(item.get("quoteMaxAmountPerOrder"))
+        merchant = item.get("nickName", "Unknown")
+
+        payments = []
+        for p in item.get("paymentMethods", []):
+            if isinstance(p, dict):
+                p = p.get("paymentMethod", "")
+            if p:
+                payments.append(catalog.from_exchange("OKX", p))
+
+        page.append(price, amount, min_amount, max_amount, merchant, payments)
+    return page, len(items)
+
+
+# One parser per maker side, so each keeps its own cache of parsed pages
+_OKX_PARSERS = {side: functools.partial(_parse_okx_page, side) for side in ("buy", "sell")}
+
+
+def fetch_okx(fiat="ETB", pay_filter=None):
+    """Fetch P2P ads from OKX."""
+    return _fetch_both_sides("OKX", _fetch_okx_side, fiat, pay_filter)
 
 
 # ---------------------------------------------------------------------------
@@ -461,25 +564,206 @@ ALL_FETCHERS = [
 ]
 
 
+SIDE_FETCHERS = {
+    "MEXC": _fetch_mexc_side,
+    "Binance": _fetch_binance_side,
+    "Bybit": _fetch_bybit_side,
+    "OKX": _fetch_okx_side,
+}
+
+
 def fetch_all(fiat="ETB", pay_filter=None):
     """Fetch P2P data from all exchanges for a given fiat. Returns list of result dicts."""
-    pay_filter = pay_filter or []
-    results = []
-    for name, fetcher in ALL_FETCHERS:
-        print(f"  Fetching {name} ({fiat})...")
-        results.append(fetcher(fiat=fiat, pay_filter=pay_filter))
-    return results
+    pair = {"fiat": fiat, "pay_filter": pay_filter or []}
+    return fetch_all_pairs([pair])[fiat]["results"]
 
 
-def fetch_all_pairs():
-    """Fetch P2P data for all configured currency pairs. Returns dict keyed by fiat."""
-    all_data = {}
-    for pair in PAIRS:
-        fiat = pair["fiat"]
+# ---------------------------------------------------------------------------
+# Concurrent refresh engine
+# ---------------------------------------------------------------------------
+# Every (pair, exchange, side) is one task on its exchange's worker pool,
+# sized to EXCHANGE_CONCURRENCY[name], so we never hit one host with more
+# parallel requests than that, and a backlog for one exchange never holds
+# up workers another exchange could use.
+_executors = {}
+_executor_lock = threading.Lock()
+
+# Side tasks still running, keyed by (asset, fiat, pay filter, exchange, side). A
+# straggler from an earlier cycle, or a fetch another caller already started,
+# is reused instead of being submitted twice.
+_inflight = {}
+
+# Refresh cycles run so far; drives the periodic full-depth sweep
+_cycle_count = 0
+
+# Last successful result per (pair key, exchange), served when a cycle's deadline
+# passes before that exchange finishes.
+_last_good = {}
+
+# (buy AdBook, sell AdBook, result) last built per (pair key, exchange), see build_result
+_built = {}
+
+# (average price, count) of the last full-depth fetch per (pair key, exchange, side)
+_full_stats = {}
+
+
+def _live_books():
+    """Books kept by the result and page caches, for adbook.compact()."""
+    for buy, sell, result in list(_built.values()):
+        yield buy
+        yield sell
+        yield from books_in({"": {"results": [result]}})
+    yield from books_in({"": {"results": list(_last_good.values())}})
+    for page, _ in transport.parsed_pages():
+        yield page
+
+
+add_live_source(_live_books)
+
+
+def _get_executor(exchange):
+    executor = _executors.get(exchange)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(exchange)
+            if executor is None:
+                executor = _executors[exchange] = ThreadPoolExecutor(
+                    max_workers=EXCHANGE_CONCURRENCY.get(exchange, 1),
+                    thread_name_prefix=f"fetch-{exchange.lower()}",
+                )
+    return executor
+
+
+def _run_side(exchange, fiat, pay_filter, side, depth, asset):
+    start = time.perf_counter()
+    try:
+        ads = SIDE_FETCHERS[exchange](fiat, pay_filter, side, depth, asset)
+    except Exception:
+        metrics.FETCH_ERRORS.inc(exchange, side)
+        raise
+    finally:
+        metrics.SIDE_SECONDS.observe(time.perf_counter() - start, exchange, side)
+    metrics.ADS_PARSED.inc(exchange, side, amount=len(ads))
+    return ads
+
+
+def _submit_side(exchange, fiat, pay_filter, side, depth=None, asset=ASSET):
+    key = (asset, fiat, tuple(pay_filter), exchange, side)
+    future = _inflight.get(key)
+    if future is None or future.done():
+        future = _get_executor(exchange).submit(_run_side, exchange, fiat, pay_filter, side, depth, asset)
+        # Read by build_result's callers, also when a later caller reuses the future
+        future.truncated = depth is not None
+        _inflight[key] = future
+    return future
+
+
+def forget_pair(pair):
+    """Drop everything cached for a pair that is no longer fetched (an evicted on-demand pair)."""
+    key = pair_key(pair)
+    asset, fiat = pair.get("asset", ASSET), pair["fiat"]
+    pay_filter = tuple(pair.get("pay_filter", []))
+    for name in SIDE_FETCHERS:
+        _last_good.pop((key, name), None)
+        _built.pop((key, name), None)
+        for side in ("buy", "sell"):
+            _full_stats.pop((key, name, side), None)
+            future = _inflight.get((asset, fiat, pay_filter, name, side))
+            # A running fetch removes nothing here; it is replaced next time
+            if future is not None and future.done():
+                _inflight.pop((asset, fiat, pay_filter, name, side), None)
+
+
+def _collect_result(exchange, key, buy_future, sell_future, deadline):
+    """Turn one exchange's side futures into a result dict."""
+    if not (buy_future.done() and sell_future.done()):
+        print(f"  [{key}] {exchange} still running after {deadline}s, keeping last result")
+        metrics.FETCH_TIMEOUTS.inc(exchange)
+        return stale_result(_last_good.get((key, exchange)), exchange, f"Timed out after {deadline}s")
+
+    try:
+        result = build_result(
+            key, exchange, buy_future.result(), sell_future.result(),
+            truncated_sides(buy_future, sell_future),
+        )
+    except Exception as e:
+        return _error_result(exchange, e)
+    _last_good[(key, exchange)] = result
+    return result
+
+
+def fetch_all_pairs(pairs=None, deadline=None, on_result=None):
+    """Fetch P2P data for all configured currency pairs. Returns dict keyed by pair key.
+
+    All (pair, exchange, side) requests run concurrently. Anything still
+    running after ``deadline`` seconds is left to finish in the background
+    and its exchange keeps the last good result for this cycle.
+
+    If given, ``on_result`` is called with a list of (pair key, result) as
+    exchanges finish, so each can be published without waiting for the
+    slowest one. An exception it raises is logged and skips only that call.
+    """
+    global _cycle_count
+    cycle_start = time.perf_counter()
+    pairs = PAIRS if pairs is None else pairs
+    deadline = CYCLE_DEADLINE if deadline is None else deadline
+    cycle = _cycle_count
+    _cycle_count += 1
+
+    futures = {}
+    for pair in pairs:
+        key = pair_key(pair)
         pay_filter = pair.get("pay_filter", [])
-        print(f"[{fiat}] Fetching all exchanges...")
-        all_data[fiat] = {
-            "results": fetch_all(fiat=fiat, pay_filter=pay_filter),
+        print(f"[{key}] Fetching all exchanges...")
+        for side in ("buy", "sell"):
+            depth = _depth_policy(pair, side, cycle)
+            for name, _ in ALL_FETCHERS:
+                futures[(key, name, side)] = _submit_side(
+                    name, pair["fiat"], pay_filter, side, depth, pair.get("asset", ASSET),
+                )
+
+    results = {}
+
+    def collect(cells):
+        batch = []
+        for key, name in cells:
+            results[(key, name)] = _collect_result(
+                name, key, futures[(key, name, "buy")], futures[(key, name, "sell")], deadline,
+            )
+            batch.append((key, results[(key, name)]))
+        if on_result is not None and batch:
+            try:
+                on_result(batch)
+            except Exception as e:
+                cells = ", ".join(f"{key}/{name}" for key, name in cells)
+                print(f"  Error publishing {cells}: {e}")
+
+    pending = {(pair_key(pair), name) for pair in pairs for name, _ in ALL_FETCHERS}
+    stop = cycle_start + deadline
+    while pending:
+        finished = {
+            (key, name) for key, name in pending
+            if futures[(key, name, "buy")].done() and futures[(key, name, "sell")].done()
+        }
+        pending -= finished
+        collect(finished)
+        remaining = stop - time.perf_counter()
+        if not pending or remaining <= 0:
+            break
+        # Each pending exchange has at least one side still running
+        wait(
+            [futures[(key, name, side)] for key, name in pending for side in ("buy", "sell")
+             if not futures[(key, name, side)].done()],
+            timeout=remaining, return_when=FIRST_COMPLETED,
+        )
+    collect(pending)
+
+    all_data = {}
+    for pair in pairs:
+        key = pair_key(pair)
+        all_data[key] = {
+            "results": [results[(key, name)] for name, _ in ALL_FETCHERS],
             "last_refresh": _now(),
         }
+    metrics.CYCLE_SECONDS.observe(time.perf_counter() - cycle_start)
     return all_data
@@ -0,0 +1,192 @@
+"""Append-only price history in SQLite, with downsampled OHLC range queries.
+
+One row per (fiat, exchange, refresh) in ``samples``. The primary key
+(fiat, exchange, ts) is also the table's clustering order (WITHOUT ROWID),
+so a range query for one series reads a contiguous slice of the b-tree.
+
+Each insert also folds the sample into an hourly OHLC row in ``hourly``,
+so queries with hour-multiple buckets (anything spanning weeks or months)
+read 120x fewer rows.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+
+from config import HISTORY_DB, HISTORY_RETENTION_DAYS
+
+FIELDS = (
+    "best_buy_price", "best_sell_price", "avg_buy_price", "avg_sell_price",
+    "buy_count", "sell_count",
+)
+
+# Max points a query returns when no bucket size is given
+MAX_POINTS = 500
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS samples (
+    fiat TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    {", ".join(f"{f} REAL" for f in FIELDS)},
+    PRIMARY KEY (fiat, exchange, ts)
+) WITHOUT ROWID
+"""
+
+_HOURLY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS hourly (
+    fiat TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    {", ".join(f"{f}_open REAL, {f}_high REAL, {f}_low REAL, {f}_close REAL, {f}_n INTEGER"
+               for f in FIELDS)},
+    PRIMARY KEY (fiat, exchange, hour)
+) WITHOUT ROWID
+"""
+
+# Fold a new sample into its hour: keep the first open, widen high/low,
+# take the latest close. SQLite's max()/min() return NULL if any argument
+# is NULL, hence the coalesce() pairs.
+_HOURLY_UPSERT = f"""
+INSERT INTO hourly (fiat, exchange, hour, {", ".join(
+    f"{f}_open, {f}_high, {f}_low, {f}_close, {f}_n" for f in FIELDS)})
+VALUES (?, ?, ?, {", ".join("?, ?, ?, ?, ?" for _ in FIELDS)})
+ON CONFLICT (fiat, exchange, hour) DO UPDATE SET {", ".join(
+    f"{f}_open = coalesce({f}_open, excluded.{f}_open), "
+    f"{f}_high = max(coalesce({f}_high, excluded.{f}_high), coalesce(excluded.{f}_high, {f}_high)), "
+    f"{f}_low = min(coalesce({f}_low, excluded.{f}_low), coalesce(excluded.{f}_low, {f}_low)), "
+    f"{f}_close = coalesce(excluded.{f}_close, {f}_close), "
+    f"{f}_n = {f}_n + excluded.{f}_n"
+    for f in FIELDS)}
+"""
+
+_local = threading.local()
+_last_prune = 0.0
+
+
+def _connect():
+    """Per-thread connection (sqlite3 connections are not shared across threads)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(HISTORY_DB, timeout=5)
+        # WAL lets API readers query while the fetcher appends
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        conn.execute(_HOURLY_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def resolve_field(field):
+    """Accept ``best_sell`` as well as ``best_sell_price``. Returns None if unknown."""
+    if f"{field}_price" in FIELDS:
+        return f"{field}_price"
+    return field if field in FIELDS else None
+
+
+def record(price_data, ts=None):
+    """Append one sample per (fiat, exchange) in a single batched transaction.
+
+    Results with an error, or stale ones (the exchange's last good result
+    re-served), are skipped rather than stored as gaps or repeats.
+    """
+    global _last_prune
+    ts = int(ts if ts is not None else time.time())
+    rows = [
+        (fiat, r["exchange"], ts, *(r.get(f) for f in FIELDS))
+        for fiat, data in price_data.items()
+        for r in data.get("results", [])
+        if not r.get("error") and not r.get("stale")
+    ]
+    if not rows:
+        return
+    hourly_rows = [
+        (fiat, exchange, ts // 3600, *(
+            x for v in values for x in (v, v, v, v, int(v is not None))
+        ))
+        for fiat, exchange, ts, *values in rows
+    ]
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO samples (fiat, exchange, ts, {', '.join(FIELDS)}) "
+            f"VALUES ({', '.join('?' * (3 + len(FIELDS)))})",
+            rows,
+        )
+        conn.executemany(_HOURLY_UPSERT, hourly_rows)
+        if time.time() - _last_prune > 3600:
+            _last_prune = time.time()
+            cutoff = ts - HISTORY_RETENTION_DAYS * 86400
+            conn.execute("DELETE FROM samples WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM hourly WHERE hour < ?", (cutoff // 3600,))
+
+
+def exchanges(fiat):
+    """Exchanges that have samples for ``fiat``."""
+    rows = _connect().execute(
+        "SELECT DISTINCT exchange FROM samples WHERE fiat = ?", (fiat,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def default_bucket(start, end):
+    """Smallest round bucket (seconds) that keeps a range under MAX_POINTS points."""
+    seconds = max(end - start, 1) / MAX_POINTS
+    for size in (30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 86400):
+        if size >= seconds:
+            return size
+    return 86400 * math.ceil(seconds / 86400)
+
+
+def ohlc(fiat, exchange, field, start, end, bucket):
+    """OHLC of ``field`` per ``bucket``-second bucket in [start, end].
+
+    Returns rows of [bucket_start, open, high, low, close, samples]. High/low
+    and counts come from one grouped scan; open/close are primary-key
+    lookups of each bucket's first and last row. Buckets that are whole
+    hours are built from the hourly table (edge hours are included whole).
+    """
+    column = resolve_field(field)
+    if column is None:
+        raise ValueError(f"unknown field {field!r}")
+    params = {
+        "fiat": fiat, "exchange": exchange, "start": int(start), "end": int(end),
+        "bucket": int(bucket),
+    }
+    if bucket % 3600 == 0:
+        rows = _connect().execute(f"""
+            WITH buckets AS (
+                SELECT hour * 3600 / :bucket AS b, MIN(hour) AS first_h, MAX(hour) AS last_h,
+                       MAX({column}_high) AS high, MIN({column}_low) AS low,
+                       SUM({column}_n) AS n
+                FROM hourly
+                WHERE fiat = :fiat AND exchange = :exchange
+                  AND hour BETWEEN :start / 3600 AND :end / 3600 AND {column}_n > 0
+                GROUP BY b
+            )
+            SELECT buckets.b * :bucket, o.{column}_open, high, low, c.{column}_close, n
+            FROM buckets
+            JOIN hourly o ON o.fiat = :fiat AND o.exchange = :exchange AND o.hour = first_h
+            JOIN hourly c ON c.fiat = :fiat AND c.exchange = :exchange AND c.hour = last_h
+            ORDER BY buckets.b
+        """, params).fetchall()
+        return [list(r) for r in rows]
+
+    rows = _connect().execute(f"""
+        WITH buckets AS (
+            SELECT ts / :bucket AS b, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                   MAX({column}) AS high, MIN({column}) AS low, COUNT(*) AS n
+            FROM samples
+            WHERE fiat = :fiat AND exchange = :exchange AND ts BETWEEN :start AND :end
+              AND {column} IS NOT NULL
+            GROUP BY b
+        )
+        SELECT buckets.b * :bucket, o.{column}, high, low, c.{column}, n
+        FROM buckets
+        JOIN samples o ON o.fiat = :fiat AND o.exchange = :exchange AND o.ts = first_ts
+        JOIN samples c ON c.fiat = :fiat AND c.exchange = :exchange AND c.ts = last_ts
+        ORDER BY buckets.b
+    """, params).fetchall()
+    return [list(r) for r in rows]
@@ -0,0 +1,256 @@
+"""Read-path load test: the API under concurrent clients while refreshes publish.
+
+    python loadtest.py [--duration 10] [--concurrency 16] [--ads 300] [--refresh 1.0]
+                       [--path /api/prices?fiat=ETB ...] [--url http://127.0.0.1:8000]
+
+Serves the app without its fetcher, fed by synthetic snapshots: every pair
+gets --ads ads per exchange and side, and a refresh thread republishes
+them with moved prices every --refresh seconds. Client threads keep one
+connection each, cycle through the paths (gzip accepted, like a browser)
+and record latency and bytes. Reports throughput, p50/p99 latency and
+bytes per response per path, plus lock waits from the server's /metrics.
+
+Without --url the app is served in-process by werkzeug, sharing the GIL
+with the clients, so the numbers are a lower bound. To measure gunicorn
+as deployed, serve the same synthetic app and point --url at it:
+
+    gunicorn --threads 4 -b 127.0.0.1:8000 'loadtest:synthetic_app(ads=300, refresh=1.0)'
+"""
+
+import os
+
+# Before the app (and config) are imported: no real fetching
+os.environ["BACKGROUND_FETCH"] = "0"
+
+import argparse
+import http.client
+import logging
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import catalog
+import fetchers
+import snapshot
+from adbook import AdBook
+from config import PAIRS
+
+FIAT = PAIRS[0]["fiat"]
+PATHS = (
+    "/",
+    f"/api/prices?fiat={FIAT}",
+    f"/api/prices?fiat={FIAT}&ads=0",
+    f"/api/price/simple?fiat={FIAT}&exchange=binance&field=best_buy",
+    f"/api/price/simple?fiat={FIAT}&field=best_sell",
+)
+
+# Mid price per fiat for the synthetic books; others use 1.0
+MID_PRICES = {"ETB": 190.0, "USD": 1.0, "EUR": 0.93}
+
+_LOCK_WAIT = re.compile(r'^p2p_lock_wait_seconds_(sum|count)\{lock="([^"]*)"\} (\S+)$', re.M)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic snapshots
+# ---------------------------------------------------------------------------
+def _book(rng, mid, ads, side):
+    """``ads`` ads best price first: buy ads above ``mid``, sell ads below."""
+    book = AdBook()
+    methods = list(catalog.CANONICAL)
+    price = mid
+    for _ in range(ads):
+        price += mid * rng.uniform(0, 0.001) * (1 if side == "buy" else -1)
+        book.append(
+            round(price, 4),
+            round(rng.uniform(50, 5000), 2),
+            round(mid * rng.choice((5, 10, 50)), 2),
+            round(mid * rng.uniform(500, 5000), 2),
+            f"Merchant{rng.randrange(500)}",
+            rng.sample(methods, rng.randint(1, 3)),
+        )
+    return book
+
+
+def synthetic_prices(ads, rng):
+    """price_data for every configured pair, with ``ads`` ads per exchange and side."""
+    data = {}
+    for pair in PAIRS:
+        key = fetchers.pair_key(pair)
+        mid = MID_PRICES.get(pair["fiat"], 1.0) * rng.uniform(0.99, 1.01)
+        data[key] = {
+            "results": [
+                fetchers.build_result(
+                    key, name, _book(rng, mid * 1.002, ads, "buy"), _book(rng, mid * 0.998, ads, "sell"),
+                )
+                for name, _ in fetchers.ALL_FETCHERS
+            ],
+            "last_refresh": fetchers._now(),
+        }
+    return data
+
+
+def _refresh_forever(ads, interval, seed):
+    rng = random.Random(seed)
+    while True:
+        time.sleep(interval)
+        snapshot.publish(synthetic_prices(ads, rng))
+
+
+def synthetic_app(ads=300, refresh=1.0, seed=0):
+    """The Flask app serving synthetic snapshots, republished every ``refresh`` seconds."""
+    import app
+
+    snapshot.publish(synthetic_prices(ads, random.Random(seed)))
+    if refresh > 0:
+        threading.Thread(
+            target=_refresh_forever, args=(ads, refresh, seed + 1), daemon=True, name="refresh",
+        ).start()
+    return app.app
+
+
+# ---------------------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------------------
+def _client(host, port, paths, offset, stop, samples):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    i = offset
+    while time.perf_counter() < stop:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            samples.append((path, time.perf_counter() - start, 0, None))
+            continue
+        samples.append((path, time.perf_counter() - start, len(body), resp.status))
+    conn.close()
+
+
+def _get(host, port, path):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        return resp.read(), resp.headers
+    finally:
+        conn.close()
+
+
+def _lock_waits(host, port):
+    """{lock: [total seconds, waits]} from the server's /metrics."""
+    body, _ = _get(host, port, "/metrics")
+    waits = {}
+    for stat, lock, value in _LOCK_WAIT.findall(body.decode()):
+        waits.setdefault(lock, [0.0, 0])[stat == "count"] = float(value)
+    return waits
+
+
+def _version(host, port):
+    _, headers = _get(host, port, f"/api/prices?fiat={FIAT}&ads=0")
+    # "<epoch>-<version>"
+    return int(headers.get("X-Snapshot-Version", "0").rpartition("-")[2])
+
+
+def run(url=None, duration=10.0, concurrency=16, paths=PATHS, ads=300, refresh=1.0):
+    """Load ``url`` (or an in-process synthetic app) for ``duration`` seconds. Returns the measurements."""
+    server = None
+    if url is None:
+        from werkzeug.serving import make_server
+
+        # Not one access log line per request
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, synthetic_app(ads, refresh), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = "127.0.0.1", server.server_port
+    else:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+    try:
+        waits_before, version_before = _lock_waits(host, port), _version(host, port)
+        samples = []
+        stop = time.perf_counter() + duration
+        clients = [
+            threading.Thread(target=_client, args=(host, port, list(paths), i, stop, samples))
+            for i in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - started
+        waits_after, version_after = _lock_waits(host, port), _version(host, port)
+    finally:
+        if server is not None:
+            server.shutdown()
+    return {
+        "elapsed": elapsed,
+        "concurrency": concurrency,
+        "samples": samples,
+        "refreshes": version_after - version_before,
+        "lock_waits": {
+            lock: [total - before[0], count - before[1]]
+            for lock, (total, count) in waits_after.items()
+            for before in [waits_before.get(lock, [0.0, 0])]
+        },
+    }
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _row(label, width, samples, elapsed):
+    latencies = sorted(s[1] for s in samples)
+    ok = [s for s in samples if s[3] is not None and s[3] < 400]
+    print(
+        f"  {label:<{width}}{len(samples) / elapsed:>8.1f}"
+        f"{_percentile(latencies, 0.5) * 1000:>9.1f}ms{_percentile(latencies, 0.99) * 1000:>9.1f}ms"
+        f"{sum(s[2] for s in ok) / max(len(ok), 1):>12.0f}{len(samples) - len(ok):>8}"
+    )
+
+
+def report(result):
+    samples, elapsed = result["samples"], result["elapsed"]
+    print(
+        f"{result['concurrency']} clients, {elapsed:.1f}s, {len(samples)} requests, "
+        f"{result['refreshes']} snapshots published meanwhile"
+    )
+    if not samples:
+        return
+    paths = list(dict.fromkeys(s[0] for s in samples))
+    waits = {lock: w for lock, w in result["lock_waits"].items() if w[1]}
+    width = max(len(label) for label in [*paths, *waits, "path"]) + 2
+    print(f"  {'path':<{width}}{'req/s':>8}{'p50':>11}{'p99':>11}{'bytes/resp':>12}{'errors':>8}")
+    for path in paths:
+        _row(path, width, [s for s in samples if s[0] == path], elapsed)
+    _row("all", width, samples, elapsed)
+    if waits:
+        print(f"  {'lock':<{width}}{'waits':>8}{'total':>11}{'mean':>11}")
+        for lock, (total, count) in sorted(waits.items()):
+            print(f"  {lock:<{width}}{count:>8.0f}{total * 1000:>9.1f}ms{total / count * 1e6:>9.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="server to load instead of an in-process one")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--ads", type=int, default=300, help="ads per exchange and side")
+    parser.add_argument("--refresh", type=float, default=1.0, help="seconds between synthetic refreshes")
+    parser.add_argument("--path", action="append", dest="paths", help="path to request (repeatable)")
+    args = parser.parse_args()
+    report(run(
+        args.url, args.duration, args.concurrency, args.paths or PATHS,
+        ads=args.ads, refresh=args.refresh,
+    ))
+
+
+if __name__ == "__main__":
+    main()
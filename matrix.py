@@ -0,0 +1,77 @@
+"""CSV/TSV price grid for spreadsheets, one response for a whole sheet.
+
+One row per (fiat, exchange), plus a "Best" row per fiat holding the
+cross-exchange bests, with a column per requested field and the fiat's
+last_refresh last. Cells are read from the snapshot's simple index (the
+same precomputed text /api/price/simple serves). Each grid is built once
+per snapshot version and parameter set, then served pre-encoded with an
+ETag like the JSON payloads.
+"""
+
+import csv
+import io
+import threading
+
+import metrics
+from payloads import NOT_AVAILABLE, encode_body
+
+DEFAULT_FIELDS = ("best_buy", "best_sell", "avg_buy", "avg_sell", "buy_count", "sell_count")
+
+# Row label of the cross-exchange bests
+BEST = "Best"
+
+FORMATS = {"csv": ",", "tsv": "\t"}
+
+# Encoded grids for the current version, keyed by (version, fiats, exchanges, fields, format)
+_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_LIMIT = 64
+
+
+def _exchange_names(snap, fiats):
+    """Every exchange with a result for any of ``fiats``, in result order."""
+    names = {}
+    for fiat in fiats:
+        for r in snap.price_data.get(fiat, {}).get("results", []):
+            names.setdefault(r["exchange"].lower(), r["exchange"])
+    return names
+
+
+def build(snap, fiats=(), exchanges=(), fields=(), fmt="csv"):
+    """The grid as text. Empty arguments mean every fiat, every exchange plus Best, DEFAULT_FIELDS."""
+    fiats = list(fiats) or list(snap.price_data)
+    fields = list(fields) or list(DEFAULT_FIELDS)
+    names = _exchange_names(snap, fiats)
+    names[""] = BEST
+    if exchanges:
+        keys = ["" if e.lower() == BEST.lower() else e.lower() for e in exchanges]
+    else:
+        keys = [*(key for key in names if key), ""]
+
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=FORMATS[fmt], lineterminator="\n")
+    writer.writerow(["fiat", "exchange", *fields, "last_refresh"])
+    index = snap.simple_index
+    for fiat in fiats:
+        last_refresh = snap.price_data.get(fiat, {}).get("last_refresh") or NOT_AVAILABLE
+        for key in keys:
+            writer.writerow([
+                fiat, names.get(key, key),
+                *(index.get((fiat, key, field), NOT_AVAILABLE) for field in fields),
+                last_refresh,
+            ])
+    return out.getvalue()
+
+
+def matrix_payload(snap, fiats=(), exchanges=(), fields=(), fmt="csv"):
+    """Encoded grid (body, gzip, ETag) for ``snap``, built once per version and arguments."""
+    key = (snap.version, tuple(fiats), tuple(exchanges), tuple(fields), fmt)
+    payload = _cache.get(key)
+    if payload is None:
+        payload = encode_body(build(snap, fiats, exchanges, fields, fmt).encode())
+        with metrics.lock_wait(_cache_lock, "matrix_cache"):
+            # Grids for older versions are never asked for again
+            if len(_cache) >= _CACHE_LIMIT or any(k[0] != snap.version for k in _cache):
+                _cache.clear()
+            _cache[key] = payload
+    return payload
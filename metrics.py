@@ -0,0 +1,214 @@
+"""In-process counters and histograms, exposed at /metrics in Prometheus text format.
+
+Each update is a dict lookup, a bisect and a short critical section, so
+instrumentation stays on in production. Values are per process: with
+several gunicorn workers each reports its own (see shared.py).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds: sub-millisecond handlers up to slow upstream pages and cycles
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+# Seconds spent waiting to acquire a lock
+LOCK_BUCKETS = (1e-6, 1e-5, 1e-4, 0.001, 0.01, 0.1, 1)
+# Response body sizes
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    """Bucketed observations per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        # Index of the first bucket whose upper bound holds the value
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One slot per bucket, then +Inf, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        out = []
+        names = (*self.labels, "le")
+        for key, counts in items:
+            running = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                running += n
+                out.append((f"{self.name}_bucket", _labels(names, (*key, _number(bound))), running))
+            out.append((f"{self.name}_sum", _labels(self.labels, key), counts[-1]))
+            out.append((f"{self.name}_count", _labels(self.labels, key), running))
+        return out
+
+
+class Gauge:
+    """Value read from ``read()`` at scrape time; a dict maps label tuples to values."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.read = read
+        _registry.append(self)
+
+    def samples(self):
+        value = self.read()
+        if isinstance(value, dict):
+            return [(self.name, _labels(self.labels, key), v) for key, v in sorted(value.items())]
+        return [(self.name, "", value)]
+
+
+@contextmanager
+def lock_wait(lock, name):
+    """Acquire ``lock`` (any lock or semaphore), recording how long that took."""
+    start = time.perf_counter()
+    with lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, name)
+        yield
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Fetch side
+# ---------------------------------------------------------------------------
+CYCLE_SECONDS = Histogram(
+    "p2p_fetch_cycle_seconds", "Wall time of one refresh cycle over every pair.",
+)
+SIDE_SECONDS = Histogram(
+    "p2p_fetch_side_seconds", "Time to fetch all pages of one side of one exchange's book.",
+    ("exchange", "side"),
+)
+PAGE_SECONDS = Histogram(
+    "p2p_fetch_page_seconds", "Latency of one page request.", ("exchange", "side", "page"),
+)
+FETCH_ERRORS = Counter(
+    "p2p_fetch_errors_total", "Side fetches that raised.", ("exchange", "side"),
+)
+FETCH_TIMEOUTS = Counter(
+    "p2p_fetch_timeouts_total", "Exchanges still running at a cycle's deadline.", ("exchange",),
+)
+ADS_PARSED = Counter(
+    "p2p_ads_parsed_total", "Ads parsed from exchange responses.", ("exchange", "side"),
+)
+PAGES_UNCHANGED = Counter(
+    "p2p_pages_unchanged_total", "Exchange pages byte-identical to one already parsed, reused.",
+    ("exchange",),
+)
+ADS_CHANGED = Counter(
+    "p2p_ads_changed_total", "Ads added or removed since the previous result.", ("exchange", "side"),
+)
+RESULTS_UNCHANGED = Counter(
+    "p2p_results_unchanged_total", "Exchange results identical to the previous one, reused.",
+    ("exchange",),
+)
+UPSTREAM_RESPONSES = Counter(
+    "p2p_upstream_responses_total", "Exchange HTTP responses by status code.", ("exchange", "status"),
+)
+UPSTREAM_ERRORS = Counter(
+    "p2p_upstream_errors_total", "Exchange requests that failed without a response.",
+    ("exchange", "error"),
+)
+BREAKER_TRIPS = Counter(
+    "p2p_breaker_trips_total", "Circuits opened after repeated failures.", ("exchange",),
+)
+PUBLISH_SECONDS = Histogram(
+    "p2p_publish_seconds", "Time to encode, index and publish a snapshot.",
+)
+
+# ---------------------------------------------------------------------------
+# Serve side
+# ---------------------------------------------------------------------------
+REQUEST_SECONDS = Histogram(
+    "p2p_http_request_seconds", "API request handling time.", ("endpoint",),
+)
+REQUESTS = Counter(
+    "p2p_http_requests_total", "API requests by status code.", ("endpoint", "status"),
+)
+RESPONSE_BYTES = Histogram(
+    "p2p_http_response_bytes", "API response body size as sent.", ("endpoint",),
+    buckets=BYTES_BUCKETS,
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "p2p_lock_wait_seconds", "Time spent waiting to acquire a lock.", ("lock",),
+    buckets=LOCK_BUCKETS,
+)
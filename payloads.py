@@ -0,0 +1,129 @@
+"""Pre-encoded API response bodies, built once per refresh instead of per request."""
+
+import gzip
+import hashlib
+import json
+
+from adbook import AdBook
+
+GZIP_LEVEL = 6
+
+
+def dumps(obj):
+    """Compact JSON, writing AdBooks straight from their columns."""
+    if isinstance(obj, AdBook):
+        return obj.to_json()
+    if isinstance(obj, dict):
+        return "{" + ",".join(
+            f"{json.dumps(str(k))}:{dumps(v)}" for k, v in obj.items()
+        ) + "}"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ",".join(dumps(v) for v in obj) + "]"
+    return json.dumps(obj)
+
+
+def encode_payload(data):
+    """Serialize ``data`` once into JSON bytes, a gzip copy and a content-hash ETag."""
+    return encode_body(dumps(data).encode())
+
+
+def encode_body(body):
+    """A ready-made response body with its gzip copy and content-hash ETag."""
+    return {
+        "body": body,
+        # mtime=0 keeps the gzip bytes identical for identical content
+        "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+        "etag": hashlib.blake2b(body, digest_size=16).hexdigest(),
+    }
+
+
+def encode_prices(price_data):
+    """Encode every fiat's /api/prices payload. Returns dict keyed by fiat."""
+    return {fiat: encode_payload(data) for fiat, data in price_data.items()}
+
+
+AD_LIST_KEYS = ("buy_ads", "sell_ads", "crossed_buy_ads")
+
+
+def decode_prices(body):
+    """Inverse of encode_payload for a fiat's price data: ad lists come back as AdBooks."""
+    data = json.loads(bytes(body))
+    for r in data.get("results", []):
+        for key in AD_LIST_KEYS:
+            r[key] = AdBook.from_ads(r.get(key, []))
+    return data
+
+
+def summarize(data):
+    """A fiat's price data without the per-ad lists."""
+    return {
+        **data,
+        "results": [
+            {k: v for k, v in r.items() if k not in AD_LIST_KEYS}
+            for r in data.get("results", [])
+        ],
+    }
+
+
+def encode_summaries(price_data):
+    """Encode every fiat's ad-free /api/prices?ads=0 payload. Returns dict keyed by fiat."""
+    return {fiat: encode_payload(summarize(data)) for fiat, data in price_data.items()}
+
+
+EMPTY_PRICES = encode_payload({"results": [], "last_refresh": None})
+
+
+# ---------------------------------------------------------------------------
+# /api/price/simple lookup index
+# ---------------------------------------------------------------------------
+NOT_AVAILABLE = "N/A"
+
+
+def _simple_fields(result):
+    """Map each field name /api/price/simple accepts to the result's value.
+
+    A field resolves to ``<field>_price`` first and to the raw key second,
+    so both ``best_buy`` and ``buy_count`` work.
+    """
+    fields = {}
+    for key, val in result.items():
+        if key in AD_LIST_KEYS or isinstance(val, (list, dict)):
+            continue
+        fields.setdefault(key, val)
+        if key.endswith("_price"):
+            fields[key[:-len("_price")]] = val
+    return fields
+
+
+def build_simple_index(price_data):
+    """Precompute every /api/price/simple answer as text.
+
+    Keys are (fiat, exchange, field) with the exchange lower-cased, or ""
+    for the best value across all exchanges (max for sell fields, min
+    otherwise). The cross-exchange entries also include
+    ``best_buy_exchange`` / ``best_sell_exchange``: where that best price is.
+    """
+    index = {}
+    for fiat, data in price_data.items():
+        best = {}
+        for r in data.get("results", []):
+            exchange = r.get("exchange", "")
+            for field, val in _simple_fields(r).items():
+                if val is None:
+                    continue
+                index.setdefault((fiat, exchange.lower(), field), str(val))
+                current = best.get(field)
+                try:
+                    better = current is None or (
+                        val > current[0] if "sell" in field else val < current[0]
+                    )
+                except TypeError:
+                    continue
+                if better:
+                    best[field] = (val, exchange)
+        for field, (val, exchange) in best.items():
+            index[(fiat, "", field)] = str(val)
+        for side in ("buy", "sell"):
+            if f"best_{side}" in best:
+                index[(fiat, "", f"best_{side}_exchange")] = best[f"best_{side}"][1]
+    return index
@@ -0,0 +1,148 @@
+"""Liquidity-aware quotes: the effective price of filling a fiat amount.
+
+Walks an exchange's (or all exchanges') price-sorted ads the way a trader
+would, taking from each ad no more than it can fill (its ``max_amount``
+and ``available_amount`` at its price) and skipping ads whose
+``min_amount`` exceeds what is left to fill.
+
+Depth curves (cumulative fiat and crypto over the fillable ads) are built
+once per refresh on top of the /api/ads side indexes, so a quote is a
+binary search into the curve plus a short walk over the final ads.
+"""
+
+from bisect import bisect_left
+from itertools import accumulate
+
+# Points returned per depth curve
+DEPTH_POINTS = 50
+
+# Payment-filtered curves memoized per snapshot, before the memo is reset
+_FILTERED_LIMIT = 64
+
+
+class DepthCurve:
+    """Cumulative liquidity over a best-price-first sequence of ads."""
+
+    def __init__(self, index, positions):
+        self.index = index
+        self.positions = []
+        self.caps = []
+        for p in positions:
+            price = index.price[p]
+            if price <= 0:
+                continue
+            # Most fiat one ad can take: its stock at its price, within its max limit
+            cap = index.available[p] * price
+            if index.max_amount[p] > 0:
+                cap = min(cap, index.max_amount[p])
+            if cap <= 0 or cap < index.min_amount[p]:
+                continue
+            self.positions.append(p)
+            self.caps.append(cap)
+        self.fiat = list(accumulate(self.caps))
+        self.crypto = list(accumulate(
+            cap / index.price[p] for cap, p in zip(self.caps, self.positions)
+        ))
+        self.depth = self._sample()
+
+    def _sample(self):
+        """Up to DEPTH_POINTS [fiat, crypto, effective price] points along the curve."""
+        n = len(self.fiat)
+        if n <= DEPTH_POINTS:
+            picks = range(n)
+        else:
+            picks = sorted({round(j * (n - 1) / (DEPTH_POINTS - 1)) for j in range(DEPTH_POINTS)})
+        return [
+            [round(self.fiat[i], 2), round(self.crypto[i], 6), round(self.fiat[i] / self.crypto[i], 4)]
+            for i in picks
+        ]
+
+    def fill(self, amount):
+        """Fill ``amount`` fiat. Returns (fills, filled fiat, crypto), fills as (position, fiat) pairs."""
+        k = bisect_left(self.fiat, amount)
+        # Every ad before k is taken whole
+        fills = list(zip(self.positions[:k], self.caps[:k]))
+        filled = self.fiat[k - 1] if k else 0.0
+        crypto = self.crypto[k - 1] if k else 0.0
+        remaining = amount - filled
+        index = self.index
+        for j in range(k, len(self.positions)):
+            if remaining <= 1e-9:
+                break
+            p = self.positions[j]
+            take = min(self.caps[j], remaining)
+            if take < index.min_amount[p]:
+                continue
+            fills.append((p, take))
+            filled += take
+            crypto += take / index.price[p]
+            remaining -= take
+        return fills, filled, crypto
+
+    def quote(self, amount):
+        """Quote dict for filling ``amount`` fiat from this curve."""
+        fills, filled, crypto = self.fill(amount)
+        best = self.index.price[self.positions[0]] if self.positions else None
+        effective = filled / crypto if crypto else None
+        ads = []
+        for p, fiat in fills:
+            ad = self.index.ad(p)
+            ad["fill_amount"] = round(fiat, 2)
+            ad["fill_crypto"] = round(fiat / ad["price"], 6)
+            ads.append(ad)
+        return {
+            "filled": round(filled, 2),
+            "crypto": round(crypto, 6),
+            "complete": amount - filled <= 0.005,
+            "effective_price": round(effective, 4) if effective else None,
+            "best_price": best,
+            "slippage_pct": round(abs(effective - best) / best * 100, 4) if effective else None,
+            "liquidity": round(self.fiat[-1], 2) if self.fiat else 0,
+            "ads": ads,
+            "depth": self.depth,
+        }
+
+
+class QuoteBook:
+    """Depth curves for one side of one fiat: merged and per exchange."""
+
+    def __init__(self, index):
+        self.index = index
+        self.merged = DepthCurve(index, range(len(index)))
+        self.exchanges = {
+            name: DepthCurve(index, sorted(positions))
+            for name, positions in sorted(index.by_exchange.items())
+        }
+        self._filtered = {}
+
+    def curves(self, payments=()):
+        """(merged curve, {exchange: curve}), restricted to ``payments`` prefixes if given."""
+        if not payments:
+            return self.merged, self.exchanges
+        key = frozenset(p.lower() for p in payments)
+        curves = self._filtered.get(key)
+        if curves is None:
+            allowed = self.index.payment_matches(payments)
+            curves = (
+                DepthCurve(self.index, sorted(allowed)),
+                {
+                    name: DepthCurve(self.index, sorted(positions & allowed))
+                    for name, positions in sorted(self.index.by_exchange.items())
+                },
+            )
+            if len(self._filtered) >= _FILTERED_LIMIT:
+                self._filtered.clear()
+            self._filtered[key] = curves
+        return curves
+
+    def quote(self, amount, payments=()):
+        merged, exchanges = self.curves(payments)
+        return {
+            "merged": merged.quote(amount),
+            "exchanges": {name: curve.quote(amount) for name, curve in exchanges.items()},
+        }
+
+
+def build_quote_books(ads_index):
+    """Quote books for one fiat's ads index. Returns {"buy", "sell"}."""
+    return {side: QuoteBook(ads_index[side]) for side in ("buy", "sell")}
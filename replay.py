@@ -0,0 +1,233 @@
+"""Record exchange responses as fixtures and replay them from a local stand-in server.
+
+    python replay.py record [--fixtures fixtures]
+        Run one full-depth refresh against the live APIs, saving every
+        response body the fetchers receive.
+
+    python replay.py serve [--port 8800] [--latency 0.05] [--jitter 0.02]
+                           [--errors 0.01] [--pages 5]
+        Serve the fixtures over HTTP. Point the app at it with
+        UPSTREAM_URL=http://127.0.0.1:8800 python app.py
+
+Fixtures live in ``<fixtures>/<endpoint>/<key>.json``, the key being the
+fiat, side and page of the request (see ENDPOINTS), prefixed with the asset
+unless it is the default ASSET (``BTC-ETB-BUY-1.json``). The stand-in answers
+requests as ``/<original host>/<path>`` (what transport sends when
+UPSTREAM_URL is set). Pages past the last recorded one are empty; with
+``--pages N`` every side has exactly N pages instead: missing pages repeat
+the last recorded one and later pages are empty.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from config import ASSET
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Path -> (fixture name, request field naming the asset, request fields that
+# make up the rest of the key, body of an empty page)
+ENDPOINTS = {
+    "/api/platform/p2p/api/market": ("mexc_market", "coinId", ("currency", "tradeType", "page"), {"data": []}),
+    "/api/platform/p2p/api/payment/method": ("mexc_payment_methods", None, (), None),
+    "/bapi/c2c/v2/friendly/c2c/adv/search": (
+        "binance_adv_search", "asset", ("fiat", "tradeType", "page"), {"data": []},
+    ),
+    "/fiat/otc/item/online": (
+        "bybit_item_online", "tokenId", ("currencyId", "side", "page"), {"result": {"items": []}},
+    ),
+    "/v3/c2c/tradingOrders/books": ("okx_books", "baseCurrency", ("quoteCurrency", "side"), None),
+}
+
+
+def _asset_symbol(field, value):
+    """The asset a request is for, from its asset field (MEXC sends a coin id)."""
+    if field == "coinId":
+        from fetchers import MEXC_COIN_IDS
+
+        return next((a for a, coin_id in MEXC_COIN_IDS.items() if coin_id == value), str(value))
+    return str(value).upper()
+
+
+def fixture_key(path, fields):
+    """(fixture name, key values) for a request, or None if the endpoint isn't known.
+
+    ``fields`` holds the query parameters and JSON body merged.
+    """
+    endpoint = ENDPOINTS.get(path)
+    if endpoint is None:
+        return None
+    name, asset_field, keys, _ = endpoint
+    values = tuple(str(fields.get(k, "")) for k in keys)
+    if asset_field and fields.get(asset_field):
+        asset = _asset_symbol(asset_field, fields[asset_field])
+        # Default-asset fixtures keep their key, so older recordings still match
+        if asset != ASSET:
+            values = (asset, *values)
+    return name, values
+
+
+def fixture_path(fixtures, name, values):
+    return os.path.join(fixtures, name, "-".join(values or ("all",)) + ".json")
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+def record(fixtures=FIXTURES_DIR):
+    """Fetch every pair once from the live APIs and save each response as a fixture."""
+    import fetchers
+    import transport
+
+    saved = []
+
+    def save(exchange, method, url, kwargs, body):
+        key = fixture_key(urlsplit(url).path, {**(kwargs.get("params") or {}), **(kwargs.get("json") or {})})
+        if key is None:
+            return
+        path = fixture_path(fixtures, *key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+        saved.append(path)
+
+    transport.set_recorder(save)
+    try:
+        fetchers.fetch_all_pairs()
+    finally:
+        transport.set_recorder(None)
+    print(f"Recorded {len(saved)} responses into {fixtures}")
+    return saved
+
+
+# ---------------------------------------------------------------------------
+# Stand-in server
+# ---------------------------------------------------------------------------
+class StandIn(ThreadingHTTPServer):
+    """HTTP server answering exchange requests from fixtures."""
+
+    daemon_threads = True
+
+    def __init__(self, address, fixtures=FIXTURES_DIR, latency=0.0, jitter=0.0,
+                 errors=0.0, pages=None):
+        super().__init__(address, _Handler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+        self.pages = pages
+        self.requests = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def body_for(self, path, fields):
+        """Fixture bytes for a request, or None if there is nothing to serve."""
+        key = fixture_key(path, fields)
+        if key is None:
+            return None
+        name, values = key
+        empty = ENDPOINTS[path][3]
+        if "page" in ENDPOINTS[path][2] and values[-1].isdigit():
+            page = int(values[-1])
+            if self.pages is not None and page > self.pages:
+                return json.dumps(empty).encode()
+            if not os.path.exists(fixture_path(self.fixtures, name, values)) and page > 1:
+                if self.pages is None:
+                    # Past the last recorded page: the book ends here
+                    return json.dumps(empty).encode()
+                # Deeper than recorded but within --pages: repeat the last recorded page
+                while page > 1 and not os.path.exists(fixture_path(self.fixtures, name, (*values[:-1], str(page)))):
+                    page -= 1
+                values = (*values[:-1], str(page))
+        path = fixture_path(self.fixtures, name, values)
+        body = self._bodies.get(path)
+        if body is None:
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                body = self._bodies[path] = f.read()
+        return body
+
+    def delay(self):
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _serve(self):
+        server = self.server
+        with server._lock:
+            server.requests += 1
+        parts = urlsplit(self.path)
+        # "/<host>/<path>" -> "<path>"
+        path = "/" + parts.path.lstrip("/").partition("/")[2]
+        fields = dict(parse_qsl(parts.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                fields.update(json.loads(self.rfile.read(length)))
+            except ValueError:
+                pass
+
+        time.sleep(server.delay())
+        if random.random() < server.errors:
+            self._send(502, b"<html>Bad Gateway</html>", "text/html")
+            return
+        body = server.body_for(path, fields)
+        if body is None:
+            self._send(404, b'{"error":"no fixture"}')
+        else:
+            self._send(200, body)
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _serve
+    do_POST = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in(port=0, **options):
+    """Run a StandIn on a daemon thread. Returns the server (its URL via ``server_port``)."""
+    server = StandIn(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("record", "serve"))
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered 502")
+    parser.add_argument("--pages", type=int, default=None, help="pages per side (default: as recorded)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.fixtures)
+        return
+    server = StandIn(
+        ("127.0.0.1", args.port), fixtures=args.fixtures, latency=args.latency,
+        jitter=args.jitter, errors=args.errors, pages=args.pages,
+    )
+    print(f"Serving {args.fixtures} on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
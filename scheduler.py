@@ -0,0 +1,241 @@
+"""Adaptive refresh scheduler: every (pair, exchange) on its own interval.
+
+Each task fetches both sides of one exchange's book for one pair through
+the shared fetch engine (one worker pool per exchange) and
+publishes its result into the snapshot as soon as it lands.
+
+- Intervals adapt to the book: a best price that moved more than
+  SCHEDULER["volatile_pct"] since the last fetch halves the interval, one
+  that moved less than "stable_pct" stretches it.
+- Failures back off exponentially. A 429 pauses every task for that
+  exchange (at least Retry-After). 5xx, timeouts and other errors back
+  off only the failing task.
+- After "breaker_failures" failures in a row the task's circuit opens:
+  its last good result is served marked stale and a single probe is sent
+  per cooldown until one succeeds.
+
+In on-demand mode (see demand.py) tasks come and go with the pairs
+clients have asked for recently.
+"""
+
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import demand
+import fetchers
+import history
+import metrics
+import snapshot
+from config import ASSET, CYCLE_DEADLINE, ON_DEMAND, PAIRS, REFRESH_INTERVAL, SCHEDULER
+from transport import UpstreamError, format_timing_summary
+
+EXCHANGES = [name for name, _ in fetchers.ALL_FETCHERS]
+
+# Longest the loop sleeps without checking for due tasks
+_TICK = 1.0
+
+
+class Task:
+    """Refresh state of one (pair, exchange)."""
+
+    def __init__(self, pair, exchange):
+        self.pair = pair
+        self.fiat = pair["fiat"]
+        self.asset = pair.get("asset", ASSET)
+        self.key = fetchers.pair_key(pair)
+        self.exchange = exchange
+        self.interval = float(REFRESH_INTERVAL)
+        self.due = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.cooldown = SCHEDULER["breaker_cooldown"]
+        self.started = None
+        self.futures = None
+        self.last_good = None
+
+    @property
+    def breaker_open(self):
+        return self.failures >= SCHEDULER["breaker_failures"]
+
+    def start(self, now):
+        pay_filter = self.pair.get("pay_filter", [])
+        self.futures = tuple(
+            fetchers._submit_side(
+                self.exchange, self.fiat, pay_filter, side,
+                fetchers._depth_policy(self.pair, side, self.runs), self.asset,
+            )
+            for side in ("buy", "sell")
+        )
+        self.started = now
+        self.runs += 1
+
+    def done(self):
+        return all(f.done() for f in self.futures)
+
+    def succeed(self, result, now):
+        """Record a good result and adapt the interval to how far prices moved."""
+        move = _price_move(self.last_good, result)
+        if move is not None:
+            if move > SCHEDULER["volatile_pct"]:
+                self.interval /= 2
+            elif move < SCHEDULER["stable_pct"]:
+                self.interval *= 1.5
+        self.interval = min(max(self.interval, SCHEDULER["min_interval"]), SCHEDULER["max_interval"])
+        if self.breaker_open:
+            print(f"  [{self.key}] {self.exchange} recovered, closing circuit")
+        self.failures = 0
+        self.cooldown = SCHEDULER["breaker_cooldown"]
+        self.last_good = result
+        self.due = now + self.interval
+        return result
+
+    def fail(self, error, now):
+        """Back off after ``error``; returns the stale last good result (or an error result)."""
+        self.failures += 1
+        delay = min(SCHEDULER["backoff_base"] * 2 ** (self.failures - 1), SCHEDULER["backoff_max"])
+        if isinstance(error, UpstreamError) and error.retry_after:
+            delay = max(delay, error.retry_after)
+        if self.breaker_open:
+            if self.failures == SCHEDULER["breaker_failures"]:
+                print(f"  [{self.key}] {self.exchange} failed {self.failures}x, opening circuit")
+                metrics.BREAKER_TRIPS.inc(self.exchange)
+            else:
+                self.cooldown = min(self.cooldown * 2, SCHEDULER["backoff_max"])
+            delay = max(delay, self.cooldown)
+        # Jitter so backed-off tasks don't all return at once
+        self.due = now + delay * random.uniform(0.9, 1.1)
+        return fetchers.stale_result(self.last_good, self.exchange, error)
+
+
+def _price_move(old, new):
+    """Largest relative best-price change (%) between two results, or None."""
+    moves = []
+    for field in ("best_buy_price", "best_sell_price"):
+        before = old.get(field) if old else None
+        after = new.get(field)
+        if before and after:
+            moves.append(abs(after - before) / before * 100)
+    return max(moves) if moves else None
+
+
+# Exchange -> time before which no task for it may start (set by 429s)
+_exchange_hold = {}
+
+_tasks = []
+
+
+def _finish(task, now):
+    """Result for a task whose futures completed (or timed out)."""
+    futures, task.futures = task.futures, None
+    if not all(f.done() for f in futures):
+        metrics.FETCH_TIMEOUTS.inc(task.exchange)
+        # The sides keep running; the next start reuses them via _inflight
+        return task.fail(TimeoutError(f"Timed out after {CYCLE_DEADLINE}s"), now)
+    error = next((f.exception() for f in futures if f.exception() is not None), None)
+    if error is None:
+        try:
+            result = fetchers.build_result(
+                task.key, task.exchange, futures[0].result(), futures[1].result(),
+                fetchers.truncated_sides(*futures),
+            )
+            return task.succeed(result, now)
+        except Exception as e:
+            error = e
+    if isinstance(error, UpstreamError) and error.rate_limited:
+        hold = now + (error.retry_after or SCHEDULER["backoff_base"])
+        _exchange_hold[task.exchange] = max(_exchange_hold.get(task.exchange, 0.0), hold)
+        print(f"  [{task.exchange}] rate limited, pausing for {hold - now:.0f}s")
+    return task.fail(error, now)
+
+
+def publish_results(results, drop=()):
+    """Merge finished (pair key, result) pairs into the snapshot and record their history."""
+    by_fiat = {}
+    for fiat, result in results:
+        by_fiat.setdefault(fiat, {})[result["exchange"]] = result
+    updates = {
+        fiat: {"results": list(fresh.values()), "last_refresh": fetchers._now()}
+        for fiat, fresh in by_fiat.items()
+    }
+    snap = snapshot.publish(updates, drop, merge=True)
+    history.record({fiat: {"results": data["results"]} for fiat, data in updates.items()})
+    return snap
+
+
+def _sync_tasks(pairs):
+    """Add tasks for new pairs; drop idle ones once they are not running."""
+    keys = {fetchers.pair_key(pair) for pair in pairs}
+    known = {t.key for t in _tasks}
+    _tasks[:] = [t for t in _tasks if t.key in keys or t.futures is not None]
+    _tasks.extend(
+        Task(pair, name) for pair in pairs if fetchers.pair_key(pair) not in known
+        for name in EXCHANGES
+    )
+
+
+def run_forever():
+    """Start, collect and publish due tasks until the process exits."""
+    _sync_tasks(PAIRS)
+    last_report = last_sync = time.time()
+    while True:
+        now = time.time()
+        evicted = ()
+        if ON_DEMAND and now - last_sync >= _TICK:
+            last_sync = now
+            pairs, evicted = demand.rotation(now)
+            _sync_tasks(pairs)
+        for task in _tasks:
+            if task.futures is None and now >= max(task.due, _exchange_hold.get(task.exchange, 0.0)):
+                task.start(now)
+
+        running = [t for t in _tasks if t.futures is not None]
+        next_due = min(
+            (max(t.due, _exchange_hold.get(t.exchange, 0.0)) for t in _tasks if t.futures is None),
+            default=now + _TICK,
+        )
+        timeout = min(max(next_due - now, 0.05), _TICK)
+        # Tasks wait for both sides, so only the sides still running can wake us
+        pending = [f for t in running for f in t.futures if not f.done()]
+        if pending:
+            wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        elif not running:
+            time.sleep(timeout)
+
+        now = time.time()
+        finished = [
+            (t.key, _finish(t, now)) for t in running
+            if t.done() or now - t.started > CYCLE_DEADLINE
+        ]
+        if finished or evicted:
+            try:
+                snap = publish_results(finished, evicted)
+                changes = []
+                if finished:
+                    changes.append("Refreshed " + ", ".join(f"{key}/{r['exchange']}" for key, r in finished))
+                if evicted:
+                    changes.append("Dropped idle " + ", ".join(evicted))
+                print(f"[{fetchers._now('%H:%M:%S')}] {'; '.join(changes)} (v{snap.version})")
+            except Exception as e:
+                print(f"[{fetchers._now('%H:%M:%S')}] Error publishing prices: {e}")
+
+        if now - last_report >= REFRESH_INTERVAL:
+            timing = format_timing_summary(since=last_report)
+            if timing:
+                print(timing)
+            last_report = now
+
+
+def task_states():
+    """{(pair key, exchange): (interval, breaker open)} for metrics and debugging."""
+    return {(t.key, t.exchange): (t.interval, t.breaker_open) for t in list(_tasks)}
+
+
+metrics.Gauge(
+    "p2p_refresh_interval_seconds", "Current refresh interval per pair and exchange.",
+    lambda: {key: state[0] for key, state in task_states().items()}, ("fiat", "exchange"),
+)
+metrics.Gauge(
+    "p2p_breaker_open", "1 while a pair/exchange circuit is open (serving stale data).",
+    lambda: {key: int(state[1]) for key, state in task_states().items()}, ("fiat", "exchange"),
+)
@@ -0,0 +1,225 @@
+"""One fetcher process, many serving workers: snapshots shared through a file.
+
+With config.SHARED_SNAPSHOT set, every gunicorn worker calls run() at
+startup. The worker that takes an exclusive flock on ``<path>.lock`` runs
+the background fetcher and writes each published snapshot to ``<path>``
+(ideally on /dev/shm). It writes a temp file and os.replace()s it over the
+old one, so readers always see a complete file.
+
+The other workers mmap each new file and serve its pre-encoded bodies as
+memoryview slices, with no copy and no re-encoding. They decode and index
+only the fiats whose ETag changed. They keep retrying the lock, so if the
+fetcher process dies, another worker takes over from the last shared
+version.
+
+The same file format persists the last snapshot across restarts (warm
+start, config.WARM_SNAPSHOT): persist() rewrites it in the background after
+publishes, and restore() serves its results at startup, each marked stale
+(reason "restored") until that exchange's result is refetched.
+
+File layout: MAGIC, version (u64), created_at (f64), restored_at (f64, 0
+if none), epoch (8 bytes, see snapshot.EPOCH), directory length
+(u32), a JSON directory {kind: {fiat: [offset, length, gzip offset,
+gzip length, etag]}}, then the bodies.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import demand
+import snapshot
+from config import SHARED_SNAPSHOT
+from payloads import decode_prices
+
+MAGIC = b"P2PSNAP3"
+_HEADER = struct.Struct("<8sQdd8sI")
+
+# Snapshot payload tables written to the file
+KINDS = ("payloads", "summaries", "arbitrage")
+
+# Seconds between checks for a new file, and between attempts to become the fetcher
+POLL_INTERVAL = 0.25
+ELECTION_INTERVAL = 2.0
+
+# Least seconds between two saves of the warm-start snapshot
+PERSIST_INTERVAL = 5.0
+
+
+def write(snap, path):
+    """Write ``snap``'s encoded payloads to ``path`` atomically."""
+    directory = {}
+    chunks = []
+    offset = 0
+    for kind in KINDS:
+        entries = directory[kind] = {}
+        for fiat, payload in getattr(snap, kind).items():
+            body, gz = payload["body"], payload["gzip"]
+            entries[fiat] = [offset, len(body), offset + len(body), len(gz), payload["etag"]]
+            chunks += (body, gz)
+            offset += len(body) + len(gz)
+    encoded = json.dumps(directory, separators=(",", ":")).encode()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(
+            MAGIC, snap.version, snap.created_at, snap.restored_at or 0.0, snap.epoch.encode(), len(encoded),
+        ))
+        f.write(encoded)
+        f.writelines(chunks)
+    os.replace(tmp, path)
+
+
+def read(path):
+    """Map ``path``. Returns (version, created_at, restored_at, epoch, {kind: {fiat: payload}}).
+
+    Bodies are memoryviews; restored_at is None if the snapshot served no restored results.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, version, created_at, restored_at, epoch, dir_len = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    start = _HEADER.size + dir_len
+    directory = json.loads(bytes(view[_HEADER.size:start]))
+    tables = {}
+    for kind, entries in directory.items():
+        tables[kind] = {
+            fiat: {
+                "body": view[start + off:start + off + length],
+                "gzip": view[start + gz_off:start + gz_off + gz_len],
+                "etag": etag,
+            }
+            for fiat, (off, length, gz_off, gz_len, etag) in entries.items()
+        }
+    return version, created_at, restored_at or None, epoch.decode(), tables
+
+
+def _restored(data):
+    """``data`` with every result marked as restored; its last_updated says when it was fetched."""
+    return {
+        **data,
+        "results": [
+            r if r.get("error") else {**r, "stale": True, "stale_reason": snapshot.RESTORED}
+            for r in data.get("results", [])
+        ],
+    }
+
+
+def restore(path, fiats=None):
+    """Publish the results saved at ``path`` (only ``fiats`` of them, if given), marked restored.
+
+    Returns the new snapshot, or None.
+    """
+    try:
+        version, created_at, restored_at, epoch, tables = read(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[shared] Ignoring unreadable snapshot {path}: {e}")
+        return None
+    # Fiats the file doesn't have keep what they have now. Published under
+    # this boot's epoch: the marked results differ from what the saved version served
+    updates = {
+        fiat: _restored(decode_prices(payload["body"]))
+        for fiat, payload in tables.get("payloads", {}).items() if fiats is None or fiat in fiats
+    }
+    snap = snapshot.publish(updates, restored_at=restored_at or created_at)
+    print(f"[shared] Serving saved snapshot {epoch}-{version} ({snap.data_age():.0f}s old) until refreshed")
+    return snap
+
+
+def persist(path, interval=PERSIST_INTERVAL):
+    """Save every published snapshot to ``path`` from a background thread.
+
+    Writes are coalesced: at most one every ``interval`` seconds, always
+    of the latest snapshot.
+    """
+    latest = []
+    ready = threading.Event()
+
+    def writer():
+        while True:
+            ready.wait()
+            ready.clear()
+            try:
+                write(latest[-1], path)
+            except OSError as e:
+                print(f"[shared] Could not save snapshot to {path}: {e}")
+            time.sleep(interval)
+
+    def listener(snap):
+        latest[:] = [snap]
+        ready.set()
+
+    threading.Thread(target=writer, daemon=True, name="persist").start()
+    snapshot.add_listener(listener)
+
+
+def _file_id(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _try_lock(path):
+    """Exclusive, non-blocking flock on ``path``; returns the open file while held, else None."""
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    # Kept open (and locked) for the life of the process
+    return f
+
+
+def _adopt(path):
+    version, created_at, restored_at, epoch, tables = read(path)
+    if version <= snapshot.current().version:
+        return
+    snapshot.adopt(
+        version, created_at,
+        tables.get("payloads", {}), tables.get("summaries", {}), tables.get("arbitrage", {}),
+        epoch=epoch, restored_at=restored_at,
+    )
+
+
+def run(fetch, path=SHARED_SNAPSHOT):
+    """Follow the shared snapshot until this worker wins the lock, then run ``fetch()``."""
+    lock_path = f"{path}.lock"
+    seen = None
+    last_attempt = 0.0
+    while True:
+        now = time.time()
+        if now - last_attempt >= ELECTION_INTERVAL:
+            last_attempt = now
+            lock = _try_lock(lock_path)
+            if lock is not None:
+                break
+        file_id = _file_id(path)
+        if file_id is not None and file_id != seen:
+            seen = file_id
+            try:
+                _adopt(path)
+            except (OSError, ValueError) as e:
+                print(f"[shared] Could not read {path}: {e}")
+        time.sleep(POLL_INTERVAL)
+
+    print(f"[shared] Worker {os.getpid()} elected fetcher, writing {path}")
+    demand.become_fetcher()
+    # Pick up where the previous fetcher left off
+    if _file_id(path) is not None:
+        try:
+            _adopt(path)
+        except (OSError, ValueError):
+            pass
+    snapshot.add_listener(lambda snap: write(snap, path))
+    write(snapshot.current(), path)
+    fetch()
@@ -0,0 +1,254 @@
+"""Immutable, versioned price snapshots published by atomic reference swap.
+
+The background fetcher builds each new Snapshot off to the side and
+publishes it by rebinding one module-level reference. Readers call
+current() and work on the object they got back without any locking; it
+is never modified after publication.
+"""
+
+import secrets
+import threading
+import time
+from types import MappingProxyType
+
+import adbook
+import deltas
+import metrics
+from arbitrage import encode_reports
+from ads_index import build_ads_index
+from config import INTERN_COMPACT_INTERVAL, PAIRS
+from fetchers import ALL_FETCHERS, pair_key
+from payloads import build_simple_index, decode_prices, encode_prices, encode_summaries
+from quote import build_quote_books
+
+
+# Identifies this boot's snapshots: versions restart with each process
+EPOCH = secrets.token_hex(4)
+
+# stale_reason of results served from a saved snapshot until refetched (see shared.restore)
+RESTORED = "restored"
+
+
+class Snapshot:
+    """One published, read-only view of every fiat's price data.
+
+    ``version`` increases by one with every publish, so it can key caches.
+    Clients get ``token`` ("<epoch>-<version>") for deltas and resume
+    points, which never matches a version from another boot.
+    """
+
+    __slots__ = (
+        "version", "epoch", "created_at", "restored_at", "price_data", "payloads", "summaries",
+        "simple_index", "ads_index", "quotes", "arbitrage",
+    )
+
+    def __init__(self, version, price_data, payloads, summaries, simple_index, ads_index,
+                 quotes, arbitrage):
+        self.version = version
+        self.epoch = EPOCH
+        self.created_at = time.time()
+        # When the restored results still served were fetched, None if there are none
+        self.restored_at = None
+        self.price_data = MappingProxyType(price_data)
+        self.payloads = MappingProxyType(payloads)
+        self.summaries = MappingProxyType(summaries)
+        self.simple_index = MappingProxyType(simple_index)
+        self.ads_index = MappingProxyType(ads_index)
+        self.quotes = MappingProxyType(quotes)
+        self.arbitrage = MappingProxyType(arbitrage)
+
+    @property
+    def token(self):
+        """Version as given to clients: unique across restarts."""
+        return f"{self.epoch}-{self.version}"
+
+    def age(self):
+        """Seconds since this snapshot was published."""
+        return time.time() - self.created_at
+
+    def data_age(self):
+        """Seconds since its oldest data was fetched: age(), unless restored results remain."""
+        return time.time() - (self.restored_at or self.created_at)
+
+
+def _initial_snapshot():
+    price_data = {pair_key(p): {"results": [], "last_refresh": None} for p in PAIRS}
+    ads_index = {fiat: build_ads_index(data) for fiat, data in price_data.items()}
+    return Snapshot(
+        0, price_data, encode_prices(price_data), encode_summaries(price_data),
+        build_simple_index(price_data), ads_index,
+        {fiat: build_quote_books(index) for fiat, index in ads_index.items()},
+        encode_reports(price_data),
+    )
+
+
+# Order of results within a fiat, for merged publishes
+_EXCHANGES = [name for name, _ in ALL_FETCHERS]
+
+_current = _initial_snapshot()
+deltas.record(_current, ())
+
+# Serializes writers only; readers never take it.
+_publish_lock = threading.Lock()
+
+# Notified on every publish, for streaming clients waiting on a new version
+_published = threading.Condition()
+
+# Called with every snapshot published or adopted here, under the publish lock (shared.py)
+_listeners = []
+
+# When the interned merchant/method tables were last compacted
+_compacted_at = time.time()
+adbook.add_live_source(lambda: adbook.books_in(_current.price_data))
+
+
+def _compact_tables():
+    """Every INTERN_COMPACT_INTERVAL seconds, recycle interned values no live book uses.
+
+    Runs under the publish lock, so the snapshot can't change meanwhile.
+    """
+    global _compacted_at
+    now = time.time()
+    if now - _compacted_at < INTERN_COMPACT_INTERVAL:
+        return
+    _compacted_at = now
+    merchants, masks, methods = adbook.compact()
+    if merchants or masks or methods:
+        print(f"[snapshot] Compacted tables: {merchants} merchants, {masks} method sets, {methods} methods freed")
+
+
+def current():
+    """Return the latest published snapshot."""
+    return _current
+
+
+def _without(table, drop):
+    return {fiat: value for fiat, value in table.items() if fiat not in drop}
+
+
+def _merge_results(base, updates):
+    """``updates`` with each fiat's results merged over ``base``'s, per exchange."""
+    merged = {}
+    for fiat, data in updates.items():
+        by_exchange = {r["exchange"]: r for r in base.get(fiat, {}).get("results", [])}
+        by_exchange.update((r["exchange"], r) for r in data["results"])
+        merged[fiat] = {
+            **data,
+            "results": [by_exchange[name] for name in _EXCHANGES if name in by_exchange],
+        }
+    return merged
+
+
+def _serves_restored(price_data):
+    return any(
+        r.get("stale_reason") == RESTORED
+        for data in price_data.values() for r in data.get("results", [])
+    )
+
+
+def publish(updates, drop=(), merge=False, restored_at=None):
+    """Merge ``updates`` (dict keyed by fiat) over the current snapshot and swap it in.
+
+    Only the updated fiats are re-encoded and re-indexed; the rest are
+    shared with the previous snapshot. Fiats in ``drop`` are removed.
+    With ``merge``, each fiat's results replace only the same exchanges'
+    results in the current snapshot (read under the publish lock, so
+    concurrent publishes aren't lost). ``restored_at`` is when restored
+    results in ``updates`` were fetched; it is carried over until none
+    is left. Returns the new snapshot.
+    """
+    global _current
+    start = time.perf_counter()
+    drop = set(drop)
+    with metrics.lock_wait(_publish_lock, "snapshot_publish"):
+        base = _current
+        if merge:
+            updates = _merge_results(base.price_data, updates)
+        price_data = {**_without(base.price_data, drop), **updates}
+        ads_index = {fiat: build_ads_index(data) for fiat, data in updates.items()}
+        snap = Snapshot(
+            base.version + 1,
+            price_data,
+            {**_without(base.payloads, drop), **encode_prices(updates)},
+            {**_without(base.summaries, drop), **encode_summaries(updates)},
+            build_simple_index(price_data),
+            {**_without(base.ads_index, drop), **ads_index},
+            {
+                **_without(base.quotes, drop),
+                **{fiat: build_quote_books(index) for fiat, index in ads_index.items()},
+            },
+            {**_without(base.arbitrage, drop), **encode_reports(updates)},
+        )
+        restored_at = restored_at or base.restored_at
+        if restored_at is not None and _serves_restored(price_data):
+            snap.restored_at = restored_at
+        # A single reference assignment: readers see either the old or the new snapshot
+        _current = snap
+        deltas.record(snap, updates)
+        _compact_tables()
+        for listener in _listeners:
+            listener(snap)
+    with _published:
+        _published.notify_all()
+    metrics.PUBLISH_SECONDS.observe(time.perf_counter() - start)
+    return snap
+
+
+def add_listener(listener):
+    """Call ``listener(snapshot)`` after each publish or adopt, in order."""
+    _listeners.append(listener)
+
+
+def adopt(version, created_at, payloads, summaries, arbitrage, epoch=EPOCH, restored_at=None):
+    """Swap in a snapshot published by another process (see shared.py).
+
+    Takes its pre-encoded payloads as they are. Fiats whose payload ETag
+    is unchanged share the current snapshot's data and indexes; the rest
+    are decoded and indexed here.
+    """
+    global _current
+    with metrics.lock_wait(_publish_lock, "snapshot_publish"):
+        base = _current
+        changed = [
+            fiat for fiat, payload in payloads.items()
+            if fiat not in base.price_data or base.payloads[fiat]["etag"] != payload["etag"]
+        ]
+        price_data = {fiat: base.price_data[fiat] for fiat in payloads if fiat not in changed}
+        price_data.update({fiat: decode_prices(payloads[fiat]["body"]) for fiat in changed})
+        ads_index = {fiat: build_ads_index(price_data[fiat]) for fiat in changed}
+        snap = Snapshot(
+            version,
+            price_data,
+            payloads,
+            summaries,
+            build_simple_index(price_data),
+            {**{f: base.ads_index[f] for f in price_data if f not in changed}, **ads_index},
+            {
+                **{f: base.quotes[f] for f in price_data if f not in changed},
+                **{fiat: build_quote_books(index) for fiat, index in ads_index.items()},
+            },
+            arbitrage,
+        )
+        snap.created_at = created_at
+        snap.epoch = epoch
+        snap.restored_at = restored_at
+        _current = snap
+        # Deltas are only precomputed from the version right before this one,
+        # and not from the empty startup snapshot (no client has it)
+        deltas.record(snap, changed if 0 < base.version == version - 1 else ())
+        _compact_tables()
+        for listener in _listeners:
+            listener(snap)
+    with _published:
+        _published.notify_all()
+    return snap
+
+
+def wait_for_update(version, timeout):
+    """Block until a snapshot newer than ``version`` is published, or ``timeout`` passes.
+
+    Returns the current snapshot either way; compare its version to tell which.
+    """
+    with _published:
+        _published.wait_for(lambda: _current.version > version, timeout=timeout)
+    return _current
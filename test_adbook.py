@@ -0,0 +1,43 @@
+"""Tests for adbook.py: columnar ad books and their interned merchant/method tables."""
+
+import json
+
+import adbook
+from adbook import MERCHANTS, AdBook
+
+# Books compact() must keep, as the snapshot and caches register theirs
+_live = []
+adbook.add_live_source(lambda: _live)
+
+
+def test_compact_recycles_only_unused_merchants(book):
+    live = book((100, 1, "compact-live", ["cbe"]))
+    book((101, 1, "compact-gone", ["cbe"]))
+    _live[:] = [live]
+    encoded = live.to_json()
+    try:
+        # The first compaction only ages the unused merchant; the second frees it
+        adbook.compact()
+        assert "compact-gone" in MERCHANTS.ids
+        adbook.compact()
+        assert "compact-gone" not in MERCHANTS.ids
+        assert "compact-live" in MERCHANTS.ids
+        # A new merchant takes a freed id; the live book still reads its own
+        size = len(MERCHANTS.values)
+        fresh = book((102, 1, "compact-new", ["telebirr"]))
+        assert len(MERCHANTS.values) == size
+        assert fresh[0]["merchant"] == "compact-new"
+        assert live[0]["merchant"] == "compact-live"
+        assert AdBook.from_ads(json.loads(encoded)).to_json() == encoded
+    finally:
+        _live.clear()
+
+
+def test_ads_with_non_finite_numbers_are_dropped(book):
+    ads = book(
+        (float("inf"), 1, "a", ["cbe"]),
+        (100, float("nan"), "b", ["cbe"]),
+        (101, 1, "c", ["cbe"], 1.0, float("inf")),
+        (102, 1, "d", ["cbe"]),
+    )
+    assert [ad["merchant"] for ad in json.loads(ads.to_json())] == ["d"]
@@ -0,0 +1,104 @@
+"""Tests for arbitrage.py: crossing every exchange's books into trades."""
+
+from pytest import approx
+
+from adbook import AdBook
+from arbitrage import find_opportunities, scan
+from fetchers import _build_result
+
+
+def _data(*results):
+    return {"results": list(results), "last_refresh": None}
+
+
+def test_buy_below_another_exchanges_sell(book):
+    trades = find_opportunities(_data(
+        _build_result("A", book((100, 2, "cheap", ["cbe"])), AdBook()),
+        _build_result("B", AdBook(), book((110, 5, "bidder", ["cbe"]))),
+    ))
+    assert len(trades) == 1
+    trade = trades[0]
+    assert (trade["buy_exchange"], trade["sell_exchange"]) == ("A", "B")
+    assert (trade["buy_merchant"], trade["sell_merchant"]) == ("cheap", "bidder")
+    # Limited by the buy ad's 2 units
+    assert trade["size"] == 2
+    assert trade["profit"] == 20
+    assert trade["payment_methods"] == ["CBE"]
+    assert trade["same_exchange"] is False
+
+
+def test_ads_without_a_shared_method_do_not_match(book):
+    assert find_opportunities(_data(
+        _build_result("A", book((100, 2, "a", ["cbe"])), AdBook()),
+        _build_result("B", AdBook(), book((110, 5, "b", ["telebirr"]))),
+    )) == []
+
+
+def test_no_trade_unless_the_books_cross(book):
+    assert find_opportunities(_data(
+        _build_result("A", book((110, 2, "a", ["cbe"])), AdBook()),
+        _build_result("B", AdBook(), book((110, 5, "b", ["cbe"]), (100, 5, "c", ["cbe"]))),
+    )) == []
+
+
+def test_crossed_book_on_one_exchange(book):
+    # The 95 buy ad is at or below the exchange's own best sell (100), so
+    # _build_result keeps it out of buy_ads; the scanner still crosses it
+    result = _build_result(
+        "A", book((95, 1, "low", ["cbe"]), (120, 1, "high", ["cbe"])), book((100, 3, "bid", ["cbe"])),
+    )
+    assert len(result["crossed_buy_ads"]) == 1
+    trades = find_opportunities(_data(result))
+    assert [(t["buy_price"], t["sell_price"]) for t in trades] == [(95, 100)]
+    assert trades[0]["same_exchange"] is True
+
+
+def test_asks_are_merged_cheapest_first_across_exchanges(book):
+    trades = find_opportunities(_data(
+        _build_result("A", book((100, 1, "a1", ["cbe"]), (103, 1, "a2", ["cbe"])), AdBook()),
+        _build_result("B", book((101, 1, "b1", ["cbe"]), (102, 1, "b2", ["cbe"])), AdBook()),
+        _build_result("C", AdBook(), book((110, 10, "bid", ["cbe"]))),
+    ))
+    assert [(t["buy_exchange"], t["buy_price"]) for t in trades] == [
+        ("A", 100), ("B", 101), ("B", 102), ("A", 103),
+    ]
+
+
+def test_trades_consume_both_ads(book):
+    trades = find_opportunities(_data(
+        _build_result("A", book((100, 3, "ask1", ["cbe"]), (101, 3, "ask2", ["cbe"])), AdBook()),
+        _build_result("B", AdBook(), book((110, 2, "bid1", ["cbe"]), (105, 2, "bid2", ["cbe"]))),
+    ))
+    # ask1 fills the higher bid first, then part of the lower; ask2 takes the rest
+    assert [(t["buy_merchant"], t["sell_merchant"], t["size"]) for t in trades] == [
+        ("ask1", "bid1", 2), ("ask1", "bid2", 1), ("ask2", "bid2", 1),
+    ]
+    # Every unit sold was bought: 4 units of bids, 6 of asks
+    assert sum(t["size"] for t in trades) == approx(4)
+
+
+def test_minimum_trade_size_is_respected(book):
+    # Needs at least 500 fiat (5 units), but the bid only takes 2
+    ask = book((100, 10, "big", ["cbe"], 500.0, 100000.0))
+    trades = find_opportunities(_data(
+        _build_result("A", ask, AdBook()),
+        _build_result("B", AdBook(), book((110, 2, "small", ["cbe"]))),
+    ))
+    assert trades == []
+
+
+def test_stale_and_failed_results_are_skipped(book):
+    stale = {**_build_result("A", book((100, 2, "a", ["cbe"])), AdBook()), "stale": True}
+    failed = {**_build_result("C", book((99, 2, "c", ["cbe"])), AdBook()), "error": "timeout"}
+    bids = _build_result("B", AdBook(), book((110, 5, "b", ["cbe"])))
+    assert find_opportunities(_data(stale, failed, bids)) == []
+
+
+def test_scan_totals(book):
+    report = scan(_data(
+        _build_result("A", book((100, 1, "a1", ["cbe"]), (102, 1, "a2", ["cbe"])), AdBook()),
+        _build_result("B", AdBook(), book((110, 5, "b", ["cbe"]))),
+    ))
+    assert report["count"] == 2
+    assert report["total_size"] == 2
+    assert report["total_profit"] == 18
@@ -0,0 +1,146 @@
+"""Tests for deltas.py: diffs between two versions of a fiat, applied as a client would."""
+
+import json
+from types import SimpleNamespace
+
+import deltas
+from adbook import AdBook
+from fetchers import _build_result
+from payloads import AD_LIST_KEYS, encode_payload
+
+
+def _decode(data):
+    """``data`` as a client receives it."""
+    return json.loads(encode_payload(data)["body"])
+
+
+def _ad_ids(ads):
+    """id -> ad, numbering repeats of the same merchant and methods (see README)."""
+    seen = {}
+    ids = {}
+    for ad in ads:
+        key = f'{ad["merchant"]}|{",".join(ad["payment_methods"])}'
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        ids[f"{key}|{n}"] = ad
+    return ids
+
+
+def _apply(old, delta):
+    """Apply a decoded delta to decoded price data, as the README tells clients to."""
+    results = {r["exchange"]: r for r in old["results"]}
+    for name in delta["removed_exchanges"]:
+        del results[name]
+    for name, entry in delta["exchanges"].items():
+        result = {**results.get(name, {"exchange": name}), **entry.get("fields", {})}
+        for key in AD_LIST_KEYS:
+            ads = _ad_ids(result.get(key, []))
+            change = entry.get(key[:-len("_ads")], {})
+            for ad_id in change.get("removed", []):
+                del ads[ad_id]
+            for ad in change.get("added", []) + change.get("changed", []):
+                ad = dict(ad)
+                ads[ad.pop("id")] = ad
+            result[key] = sorted(ads.values(), key=lambda ad: ad["price"], reverse=key == "sell_ads")
+        results[name] = result
+    return {
+        "results": results,
+        "last_refresh": delta.get("last_refresh", old["last_refresh"]),
+    }
+
+
+def _assert_applies(old, new):
+    delta = _decode(deltas.diff_fiat(old, new))
+    applied = _apply(_decode(old), delta)
+    expected = _decode(new)
+    assert applied["last_refresh"] == expected["last_refresh"]
+    assert applied["results"] == {r["exchange"]: r for r in expected["results"]}
+    return delta
+
+
+def test_unchanged_data_gives_an_empty_delta(book):
+    data = {"results": [_build_result("Binance", book((190, 5, "a", ["cbe"])), AdBook())],
+            "last_refresh": "2024-01-01 10:00:00"}
+    assert deltas.diff_fiat(data, data) == {"exchanges": {}, "removed_exchanges": []}
+    assert deltas.diff_fiat(data, {**data}) == {"exchanges": {}, "removed_exchanges": []}
+
+
+def test_added_changed_and_removed_ads(book):
+    old = {
+        "results": [_build_result(
+            "Binance",
+            book((191, 5, "a", ["cbe"]), (192, 3, "b", ["telebirr"]), (193, 1, "c", ["cbe"])),
+            book((185, 2, "d", ["cbe"])),
+        )],
+        "last_refresh": "2024-01-01 10:00:00",
+    }
+    new = {
+        "results": [_build_result(
+            "Binance",
+            # a's amount changed, b gone, c unchanged, e new
+            book((191, 4, "a", ["cbe"]), (193, 1, "c", ["cbe"]), (194, 9, "e", ["cbe", "telebirr"])),
+            book((185, 2, "d", ["cbe"])),
+        )],
+        "last_refresh": "2024-01-01 10:00:30",
+    }
+    delta = _assert_applies(old, new)
+    buy = delta["exchanges"]["Binance"]["buy"]
+    assert [ad["id"] for ad in buy["added"]] == ["e|CBE,Tele Birr|0"]
+    assert [ad["id"] for ad in buy["changed"]] == ["a|CBE|0"]
+    assert buy["removed"] == ["b|Tele Birr|0"]
+    assert "sell" not in delta["exchanges"]["Binance"]
+    assert delta["last_refresh"] == "2024-01-01 10:00:30"
+
+
+def test_repeated_merchant_and_methods_are_numbered(book):
+    old = {"results": [_build_result(
+        "OKX", book((190, 1, "a", ["cbe"]), (191, 2, "a", ["cbe"]), (192, 3, "a", ["cbe"])), AdBook(),
+    )], "last_refresh": None}
+    new = {"results": [_build_result(
+        "OKX", book((191, 2, "a", ["cbe"]), (192, 3, "a", ["cbe"])), AdBook(),
+    )], "last_refresh": None}
+    delta = _assert_applies(old, new)
+    assert delta["exchanges"]["OKX"]["buy"]["removed"] == ["a|CBE|2"]
+
+
+def test_exchanges_added_and_removed(book):
+    binance = _build_result("Binance", book((190, 5, "a", ["cbe"])), AdBook())
+    old = {"results": [binance, _build_result("MEXC", book((191, 5, "m", ["cbe"])), AdBook())],
+           "last_refresh": None}
+    new = {"results": [binance, _build_result("Bybit", book((189, 2, "y", ["cbe"])), AdBook())],
+           "last_refresh": None}
+    delta = _assert_applies(old, new)
+    assert delta["removed_exchanges"] == ["MEXC"]
+    # An unchanged result object is skipped outright
+    assert set(delta["exchanges"]) == {"Bybit"}
+
+
+def test_crossed_buy_ads_are_diffed(book):
+    old = {"results": [_build_result("Bybit", book((195, 1, "a", ["cbe"])), book((190, 1, "s", ["cbe"])))],
+           "last_refresh": None}
+    # b's ad at 189 is crossed: at or below the best sell price
+    new = {"results": [_build_result(
+        "Bybit", book((189, 1, "b", ["cbe"]), (195, 1, "a", ["cbe"])), book((190, 1, "s", ["cbe"])),
+    )], "last_refresh": None}
+    delta = _assert_applies(old, new)
+    assert [ad["id"] for ad in delta["exchanges"]["Bybit"]["crossed_buy"]["added"]] == ["b|CBE|0"]
+
+
+def test_unknown_version_gets_a_full_resync(book):
+    data = {"results": [_build_result("OKX", book((190, 1, "a", ["cbe"])), AdBook())], "last_refresh": None}
+    snap = SimpleNamespace(version=10 ** 9, token="test-1000000000", price_data={"TEST": data})
+    payload = json.loads(deltas.delta_payload("TEST", "test-5", snap)["body"])
+    assert payload["full"] is True
+    assert payload["data"] == _decode(data)
+
+
+def test_version_from_another_boot_gets_a_full_resync(book):
+    data = {"results": [_build_result("OKX", book((190, 1, "a", ["cbe"])), AdBook())], "last_refresh": None}
+    old = SimpleNamespace(version=7, token="aaaa-7", price_data={"TEST": data})
+    new = SimpleNamespace(version=8, token="aaaa-8", price_data={"TEST": data})
+    deltas.record(old, ())
+    deltas.record(new, ())
+    assert json.loads(deltas.delta_payload("TEST", "aaaa-7", new)["body"])["full"] is False
+    # Same version number, different boot
+    assert json.loads(deltas.delta_payload("TEST", "bbbb-7", new)["body"])["full"] is True
+    assert json.loads(deltas.delta_payload("TEST", "7", new)["body"])["full"] is True
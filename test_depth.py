@@ -0,0 +1,60 @@
+"""Tests for adaptive pagination in fetchers.py: when paging stops, and what truncated sweeps publish."""
+
+import fetchers
+from adbook import AdBook
+from fetchers import _depth_policy, _depth_reached, build_result
+
+POLICY = {"price_band_pct": 2.0, "liquidity_target": 100, "full_depth_every": 10}
+
+
+def test_full_sweeps_never_stop_early(book):
+    ads = book((100, 500, "a", ["cbe"]), (150, 500, "b", ["cbe"]))
+    assert _depth_reached(ads, None) is False
+    assert _depth_reached(AdBook(), POLICY) is False
+
+
+def test_stops_past_the_price_band(book):
+    # Within 2% of the best price, and short of the target: keep paging
+    assert not _depth_reached(book((100, 10, "a", ["cbe"]), (102, 10, "b", ["cbe"])), POLICY)
+    assert _depth_reached(book((100, 10, "a", ["cbe"]), (102.5, 10, "b", ["cbe"])), POLICY)
+    # Sell books run best (highest) first: the band is measured either way
+    assert _depth_reached(book((100, 10, "a", ["cbe"]), (97.5, 10, "b", ["cbe"])), POLICY)
+
+
+def test_stops_once_the_liquidity_target_is_met(book):
+    ads = book((100, 60, "a", ["cbe"]), (100.5, 40, "b", ["cbe"]))
+    assert _depth_reached(ads, POLICY)
+    assert not _depth_reached(ads, {**POLICY, "liquidity_target": 101})
+    # No target for the asset: the band alone decides
+    assert not _depth_reached(ads, {**POLICY, "liquidity_target": None})
+
+
+def test_policy_overrides_and_full_depth_cycles():
+    pair = {
+        "fiat": "TST", "asset": "BTC",
+        "pagination": {"price_band_pct": 1, "sell": {"price_band_pct": 0.5}},
+    }
+    assert _depth_policy(pair, "buy", 0) is None
+    buy, sell = _depth_policy(pair, "buy", 1), _depth_policy(pair, "sell", 1)
+    assert (buy["price_band_pct"], sell["price_band_pct"]) == (1, 0.5)
+    # The per-asset target resolves to the pair's asset
+    assert buy["liquidity_target"] == fetchers.PAGINATION["liquidity_target"]["BTC"]
+    every = fetchers.PAGINATION["full_depth_every"]
+    assert _depth_policy(pair, "buy", every) is None
+
+
+def test_truncated_sweeps_keep_the_full_sweeps_averages(book):
+    full = book((100, 1, "a", ["cbe"]), (101, 1, "b", ["cbe"]), (105, 1, "c", ["cbe"]))
+    top = book((100, 1, "a", ["cbe"]), (101, 1, "b", ["cbe"]))
+    try:
+        result = build_result("DEPTH", "OKX", full, AdBook())
+        assert (result["avg_buy_price"], result["buy_count"]) == (102, 3)
+        result = build_result("DEPTH", "OKX", top, AdBook(), ("buy",))
+        assert (result["avg_buy_price"], result["buy_count"]) == (102, 3)
+        assert result["best_buy_price"] == 100
+        assert len(result["buy_ads"]) == 2
+        # The next full sweep records its own
+        result = build_result("DEPTH", "OKX", top, AdBook())
+        assert (result["avg_buy_price"], result["buy_count"]) == (100.5, 2)
+    finally:
+        fetchers.forget_pair({"fiat": "DEPTH"})
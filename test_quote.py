@@ -0,0 +1,113 @@
+"""Tests for quote.py: filling a fiat amount along a depth curve."""
+
+import pytest
+from pytest import approx
+
+from adbook import AdBook
+from ads_index import SideIndex
+from quote import DepthCurve, QuoteBook
+
+
+def _index(**books):
+    """Buy-side index over one book per exchange."""
+    return SideIndex([{"exchange": name, "buy_ads": book} for name, book in books.items()], "buy")
+
+
+@pytest.fixture
+def limit_book(book):
+    """Book from (price, available, min_amount, max_amount) tuples, one merchant each."""
+    return lambda *ads: book(*(
+        (price, available, f"m{n}", ["cbe"], min_amount, max_amount)
+        for n, (price, available, min_amount, max_amount) in enumerate(ads)
+    ))
+
+
+@pytest.fixture
+def depth_book(limit_book):
+    # Fillable fiat per ad: 500 (max limit), 505 (stock), 5000 (max limit, min 2000), 300
+    return limit_book(
+        (100, 10, 10, 500),
+        (101, 5, 10, 1000),
+        (102, 100, 2000, 5000),
+        (104, 100, 10, 300),
+    )
+
+
+def test_curve_caps_each_ad(depth_book):
+    curve = DepthCurve(_index(A=depth_book), range(4))
+    assert curve.caps == approx([500, 505, 5000, 300])
+    assert curve.fiat == approx([500, 1005, 6005, 6305])
+    assert curve.crypto[-1] == approx(5 + 5 + 5000 / 102 + 300 / 104)
+
+
+def test_unfillable_ads_are_left_out(limit_book):
+    index = _index(A=limit_book(
+        (0, 10, 1, 100),      # no price
+        (100, 0, 1, 100),     # nothing available
+        (101, 1, 200, 1000),  # stock (101) below its own minimum
+        (102, 1, 1, 1000),
+    ))
+    curve = DepthCurve(index, range(len(index)))
+    assert [index.price[p] for p in curve.positions] == [102]
+
+
+def test_partial_fill_of_the_first_ad(depth_book):
+    fills, filled, crypto = DepthCurve(_index(A=depth_book), range(4)).fill(300)
+    assert fills == [(0, 300)]
+    assert filled == approx(300)
+    assert crypto == approx(3)
+
+
+def test_fill_takes_whole_ads_then_part_of_the_next(depth_book):
+    fills, filled, crypto = DepthCurve(_index(A=depth_book), range(4)).fill(700)
+    assert fills == [(0, 500), (1, approx(200))]
+    assert filled == approx(700)
+    assert crypto == approx(5 + 200 / 101)
+
+
+def test_ad_whose_minimum_exceeds_the_rest_is_skipped(depth_book):
+    # After 1005 from the first two ads, 495 is left: below the third ad's
+    # 2000 minimum, so the fourth ad fills 300 of it
+    fills, filled, crypto = DepthCurve(_index(A=depth_book), range(4)).fill(1500)
+    assert [p for p, _ in fills] == [0, 1, 3]
+    assert filled == approx(1305)
+    assert crypto == approx(5 + 5 + 300 / 104)
+
+
+def test_fill_beyond_the_book_takes_everything(depth_book):
+    curve = DepthCurve(_index(A=depth_book), range(4))
+    _, filled, crypto = curve.fill(10 ** 6)
+    assert filled == approx(curve.fiat[-1])
+    assert crypto == approx(curve.crypto[-1])
+
+
+def test_quote_reports_an_incomplete_fill(depth_book):
+    quote = DepthCurve(_index(A=depth_book), range(4)).quote(1500)
+    assert quote["complete"] is False
+    assert quote["filled"] == 1305
+    assert quote["best_price"] == 100
+    assert quote["effective_price"] == round(1305 / (10 + 300 / 104), 4)
+    assert quote["liquidity"] == 6305
+    assert [ad["fill_amount"] for ad in quote["ads"]] == [500, 505, 300]
+    assert quote["ads"][0]["exchange"] == "A"
+
+
+def test_quote_of_an_empty_curve():
+    quote = DepthCurve(_index(A=AdBook()), ()).quote(100)
+    assert quote["filled"] == 0
+    assert quote["complete"] is False
+    assert quote["effective_price"] is None
+    assert quote["ads"] == []
+
+
+def test_merged_quote_walks_every_exchange_best_first(limit_book):
+    book = QuoteBook(_index(
+        A=limit_book((100, 1, 10, 1000), (103, 10, 10, 1000)),
+        B=limit_book((101, 1, 10, 1000), (102, 1, 10, 1000)),
+    ))
+    quote = book.quote(300)
+    assert [ad["price"] for ad in quote["merged"]["ads"]] == [100, 101, 102]
+    assert quote["merged"]["complete"] is True
+    assert [ad["price"] for ad in quote["exchanges"]["A"]["ads"]] == [100, 103]
+    assert [ad["price"] for ad in quote["exchanges"]["B"]["ads"]] == [101, 102]
+    assert quote["exchanges"]["B"]["complete"] is False
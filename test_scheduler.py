@@ -0,0 +1,103 @@
+"""Tests for scheduler.py: backoff, rate-limit holds and circuit breakers."""
+
+from concurrent.futures import Future
+
+import pytest
+from pytest import approx
+
+import scheduler
+from adbook import AdBook
+from config import SCHEDULER
+from transport import UpstreamError
+
+PAIR = {"fiat": "TST", "label": "USDT/TST", "pay_filter": []}
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(scheduler.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(scheduler, "_exchange_hold", {})
+
+
+def _done(*outcomes):
+    """Task futures (buy, sell), already resolved to a book or an exception."""
+    futures = []
+    for outcome in outcomes:
+        future = Future()
+        if isinstance(outcome, Exception):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+        futures.append(future)
+    return tuple(futures)
+
+
+def _task(last_good=None):
+    task = scheduler.Task(PAIR, "OKX")
+    task.last_good = last_good
+    return task
+
+
+def _finished_task(book):
+    """Task whose two sides both fetched a one-ad book."""
+    task = _task()
+    task.futures = _done(book((100, 1, "a", ["cbe"])), book((95, 1, "b", ["cbe"])))
+    return task
+
+
+def test_failures_back_off_exponentially():
+    task = _task()
+    base = SCHEDULER["backoff_base"]
+    task.fail(TimeoutError(), 0.0)
+    assert task.due == approx(base)
+    task.fail(TimeoutError(), 0.0)
+    assert task.due == approx(2 * base)
+    task.failures = 20
+    task.fail(TimeoutError(), 0.0)
+    assert task.due == approx(SCHEDULER["backoff_max"])
+
+
+def test_rate_limit_holds_the_exchange_for_retry_after(book):
+    task = _task()
+    task.futures = _done(UpstreamError("OKX", 429, retry_after=90), book((100, 1, "a", ["cbe"])))
+    result = scheduler._finish(task, 1000.0)
+    assert result["error"] == "OKX returned HTTP 429"
+    # Longer than the first backoff step, so Retry-After wins for the task and the exchange
+    assert task.due == approx(1090)
+    assert scheduler._exchange_hold["OKX"] == approx(1090)
+
+
+def test_server_errors_back_off_only_the_task():
+    task = _task()
+    task.futures = _done(UpstreamError("OKX", 503), AdBook())
+    scheduler._finish(task, 1000.0)
+    assert task.due == approx(1000 + SCHEDULER["backoff_base"])
+    assert scheduler._exchange_hold == {}
+
+
+def test_breaker_opens_probes_and_closes(book):
+    good = scheduler._finish(_finished_task(book), 0.0)
+    task = _task(last_good=good)
+    for _ in range(SCHEDULER["breaker_failures"]):
+        result = task.fail(TimeoutError("slow"), 0.0)
+    # Open: the last good result is served stale, and the probe waits a cooldown
+    assert task.breaker_open
+    assert result["stale"] is True and result["stale_reason"] == "slow"
+    assert result["best_buy_price"] == good["best_buy_price"]
+    cooldown = SCHEDULER["breaker_cooldown"]
+    assert task.due >= cooldown
+    # A failed probe doubles the cooldown
+    task.fail(TimeoutError("slow"), 0.0)
+    assert task.cooldown == 2 * cooldown
+    assert task.due >= 2 * cooldown
+    # A successful probe closes it
+    task.futures = _finished_task(book).futures
+    result = scheduler._finish(task, 0.0)
+    assert not task.breaker_open
+    assert result["stale"] is False
+    assert task.cooldown == cooldown
+
+
+def test_failure_without_a_good_result_is_an_error():
+    result = _task().fail(TimeoutError("slow"), 0.0)
+    assert result["error"] == "slow"
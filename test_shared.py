@@ -0,0 +1,88 @@
+"""Tests for shared.py: the snapshot file written by the fetcher and adopted by followers."""
+
+import json
+from types import SimpleNamespace
+
+import shared
+import snapshot
+from adbook import AdBook
+from arbitrage import encode_reports
+from fetchers import _build_result
+from payloads import encode_prices, encode_summaries
+
+FIAT = "TST"
+
+
+def _snap(version, price_data, restored_at=None):
+    """A published-looking snapshot of ``price_data``, as the fetcher would write it."""
+    return SimpleNamespace(
+        version=version, epoch="feedbeef", created_at=1700000000.0, restored_at=restored_at,
+        payloads=encode_prices(price_data), summaries=encode_summaries(price_data),
+        arbitrage=encode_reports(price_data),
+    )
+
+
+def _price_data(book):
+    return {FIAT: {
+        "results": [_build_result("OKX", book((190, 5, "a", ["cbe"])), AdBook())],
+        "last_refresh": "2024-01-01 10:00:00",
+    }}
+
+
+def test_write_and_read_round_trip(tmp_path, book):
+    snap = _snap(42, _price_data(book))
+    path = tmp_path / "snapshot.bin"
+    shared.write(snap, path)
+    version, created_at, restored_at, epoch, tables = shared.read(path)
+    assert (version, created_at, restored_at, epoch) == (42, 1700000000.0, None, "feedbeef")
+    for kind in shared.KINDS:
+        payload, written = tables[kind][FIAT], getattr(snap, kind)[FIAT]
+        assert bytes(payload["body"]) == written["body"]
+        assert bytes(payload["gzip"]) == written["gzip"]
+        assert payload["etag"] == written["etag"]
+
+
+def test_follower_adopts_a_newer_file_only(tmp_path, book):
+    path = tmp_path / "snapshot.bin"
+    version = snapshot.current().version + 100
+    shared.write(_snap(version, _price_data(book)), path)
+    shared._adopt(path)
+    adopted = snapshot.current()
+    assert adopted.token == f"feedbeef-{version}"
+    assert adopted.created_at == 1700000000.0
+    # Served as written, and decoded for the indexes
+    assert json.loads(bytes(adopted.payloads[FIAT]["body"]))["results"][0]["best_buy_price"] == 190
+    assert adopted.price_data[FIAT]["results"][0]["buy_ads"].price[0] == 190
+    assert adopted.simple_index[(FIAT, "okx", "best_buy")] == "190.0"
+    # An older version is ignored
+    shared.write(_snap(version - 1, _price_data(book)), path)
+    shared._adopt(path)
+    assert snapshot.current() is adopted
+
+
+def _refetched(result):
+    """Publish one refetched result the way the scheduler does."""
+    return snapshot.publish({FIAT: {"results": [result], "last_refresh": "2024-01-01 10:05:00"}}, merge=True)
+
+
+def test_restored_results_stay_marked_until_refetched(tmp_path, book):
+    path = tmp_path / "snapshot.bin"
+    data = _price_data(book)
+    data[FIAT]["results"].append(_build_result("Bybit", book((191, 5, "b", ["cbe"])), AdBook()))
+    shared.write(_snap(7, data), path)
+    restored = shared.restore(path, {FIAT})
+    # Republished under this boot's epoch, every result marked
+    assert restored.epoch == snapshot.EPOCH
+    assert [r["stale_reason"] for r in restored.price_data[FIAT]["results"]] == ["restored", "restored"]
+    body = json.loads(bytes(restored.payloads[FIAT]["body"]))
+    assert all(r["stale"] for r in body["results"])
+    assert restored.restored_at == 1700000000.0
+    assert restored.data_age() > restored.age()
+    # Refetching one exchange clears only its marker, and the age stays the restored data's
+    snap = _refetched(_build_result("OKX", book((189, 5, "a", ["cbe"])), AdBook()))
+    assert {r["exchange"]: r["stale_reason"] for r in snap.price_data[FIAT]["results"]} == {
+        "Bybit": "restored", "OKX": None,
+    }
+    assert snap.restored_at == 1700000000.0
+    snap = _refetched(_build_result("Bybit", book((192, 5, "b", ["cbe"])), AdBook()))
+    assert snap.restored_at is None
@@ -0,0 +1,303 @@
+"""Pooled HTTP sessions per exchange host, with per-request timing."""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+import catalog
+import metrics
+from config import EXCHANGE_CONCURRENCY, UPSTREAM_URL
+
+# Recent timing records kept per exchange
+TIMING_HISTORY = 500
+
+# Parsed pages kept for reuse, keyed by (parse function, catalog generation,
+# body hash): a page parsed before the payment method tables loaded names
+# methods differently
+PARSED_PAGES = 512
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_timings = {}
+_timings_lock = threading.Lock()
+_parsed = OrderedDict()
+_parsed_lock = threading.Lock()
+
+# Seconds spent opening TCP/TLS connections by the current thread's request
+_connect_time = threading.local()
+
+# Base URL requests are redirected to, and a callback given every response
+# body; both set by the replay harness (replay.py, bench.py)
+_upstream = UPSTREAM_URL
+_recorder = None
+
+
+# ---------------------------------------------------------------------------
+# Connection classes that record how long connect() (TCP + TLS) takes
+# ---------------------------------------------------------------------------
+def _add_connect_time(seconds):
+    _connect_time.value = getattr(_connect_time, "value", 0.0) + seconds
+
+
+def _timed_adapter_class():
+    """HTTPAdapter whose connection pools time every new connection.
+
+    requests and urllib3 are imported here, on the first session, so that
+    importing the app (and a worker becoming ready) doesn't wait for them.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                _add_connect_time(time.perf_counter() - start)
+
+    class _TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                _add_connect_time(time.perf_counter() - start)
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class _TimedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _TimedHTTPConnectionPool,
+                "https": _TimedHTTPSConnectionPool,
+            }
+
+    return _TimedAdapter
+
+
+_adapter_class = None
+
+
+def _request_exception():
+    import requests
+    return requests.RequestException
+
+
+# ---------------------------------------------------------------------------
+# Sessions
+# ---------------------------------------------------------------------------
+def get_session(exchange):
+    """Return the shared keep-alive session for an exchange, creating it once."""
+    global _adapter_class
+    session = _sessions.get(exchange)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(exchange)
+        if session is None:
+            import requests
+            from urllib3.util.request import ACCEPT_ENCODING
+
+            if _adapter_class is None:
+                _adapter_class = _timed_adapter_class()
+            # One pooled connection per concurrent fetch to this host
+            pool_size = EXCHANGE_CONCURRENCY.get(exchange, 1)
+            adapter = _adapter_class(pool_connections=2, pool_maxsize=pool_size)
+            session = requests.Session()
+            # "gzip,deflate" plus "br" when the optional brotli package is
+            # installed (urllib3 only advertises encodings it can decode)
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[exchange] = session
+    return session
+
+
+class UpstreamError(Exception):
+    """An exchange answered 429 (rate limited) or 5xx; ``retry_after`` is in seconds, if sent."""
+
+    def __init__(self, exchange, status, retry_after=None):
+        super().__init__(f"{exchange} returned HTTP {status}")
+        self.exchange = exchange
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self):
+        return self.status == 429
+
+
+def _retry_after(resp):
+    try:
+        return max(float(resp.headers.get("Retry-After", "")), 0.0)
+    except ValueError:
+        return None
+
+
+def set_upstream(base_url):
+    """Send requests to ``base_url``/<host>/<path> instead of the exchanges ("" to undo)."""
+    global _upstream
+    _upstream = base_url.rstrip("/")
+
+
+def set_recorder(recorder):
+    """Call ``recorder(exchange, method, url, kwargs, body)`` after every response (None to stop)."""
+    global _recorder
+    _recorder = recorder
+
+
+def _redirect(url):
+    parts = urlsplit(url)
+    return f"{_upstream}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def request_json(exchange, method, url, parse=None, **kwargs):
+    """Send a request on the exchange's pooled session and return parsed JSON.
+
+    Records connect (TCP + TLS, zero on a reused connection), time to first
+    byte, body download and JSON parse time for the request. Raises
+    UpstreamError on 429 and 5xx responses.
+
+    With ``parse``, returns ``parse(data)`` instead. A body byte-identical
+    to one already parsed returns that result again without decoding the
+    JSON, so ``parse`` must return something its callers never modify.
+    """
+    session = get_session(exchange)
+    target = _redirect(url) if _upstream else url
+    _connect_time.value = 0.0
+    start = time.perf_counter()
+    # stream=True returns as soon as the headers arrive, so the body
+    # download can be timed separately
+    try:
+        resp = session.request(method, target, stream=True, **kwargs)
+    except _request_exception() as e:
+        metrics.UPSTREAM_ERRORS.inc(exchange, type(e).__name__)
+        raise
+    headers_at = time.perf_counter()
+    metrics.UPSTREAM_RESPONSES.inc(exchange, str(resp.status_code))
+    body = b""
+    downloaded_at = headers_at
+    reused = False
+    try:
+        # A body that fails mid-download still counts as an error and gets a timing record
+        try:
+            body = resp.content
+        except _request_exception() as e:
+            metrics.UPSTREAM_ERRORS.inc(exchange, type(e).__name__)
+            raise
+        finally:
+            downloaded_at = time.perf_counter()
+        if _recorder is not None:
+            _recorder(exchange, method, url, kwargs, body)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise UpstreamError(exchange, resp.status_code, _retry_after(resp))
+        if parse is None:
+            return resp.json()
+        key = (parse, catalog.generation, hashlib.blake2b(body, digest_size=16).digest())
+        with _parsed_lock:
+            value = _parsed.get(key)
+            if value is not None:
+                _parsed.move_to_end(key)
+        if value is not None:
+            reused = True
+            metrics.PAGES_UNCHANGED.inc(exchange)
+            return value
+        value = parse(resp.json())
+        with _parsed_lock:
+            _parsed[key] = value
+            if len(_parsed) > PARSED_PAGES:
+                _parsed.popitem(last=False)
+        return value
+    finally:
+        parsed_at = time.perf_counter()
+        connect = _connect_time.value
+        _record(exchange, {
+            "method": method,
+            "url": url,
+            "status": resp.status_code,
+            "connect": connect,
+            "ttfb": headers_at - start - connect,
+            "download": downloaded_at - headers_at,
+            "parse": parsed_at - downloaded_at,
+            "bytes": len(body),
+            "encoding": resp.headers.get("Content-Encoding", "identity"),
+            "reused": reused,
+            "at": time.time(),
+        })
+
+
+def parsed_pages():
+    """The parse results currently kept for reuse."""
+    with _parsed_lock:
+        return list(_parsed.values())
+
+
+def get_json(exchange, url, **kwargs):
+    return request_json(exchange, "GET", url, **kwargs)
+
+
+def post_json(exchange, url, **kwargs):
+    return request_json(exchange, "POST", url, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Timing records
+# ---------------------------------------------------------------------------
+def _record(exchange, entry):
+    with metrics.lock_wait(_timings_lock, "transport_timings"):
+        history = _timings.get(exchange)
+        if history is None:
+            history = _timings[exchange] = deque(maxlen=TIMING_HISTORY)
+        history.append(entry)
+
+
+def recent_timings(exchange=None, since=0.0):
+    """Return timing records (newest last), optionally for one exchange only."""
+    with _timings_lock:
+        names = [exchange] if exchange else list(_timings)
+        return {
+            name: [t for t in _timings.get(name, ()) if t["at"] >= since]
+            for name in names
+        }
+
+
+def timing_summary(since=0.0):
+    """Aggregate timing per exchange: request count, new connections and ms per phase."""
+    summary = {}
+    for name, entries in recent_timings(since=since).items():
+        if not entries:
+            continue
+        count = len(entries)
+        summary[name] = {
+            "requests": count,
+            "new_connections": sum(1 for t in entries if t["connect"] > 0),
+            "unchanged": sum(1 for t in entries if t.get("reused")),
+            "bytes": sum(t["bytes"] for t in entries),
+        }
+        for phase in ("connect", "ttfb", "download", "parse"):
+            total = sum(t[phase] for t in entries)
+            summary[name][f"{phase}_ms_total"] = round(total * 1000, 1)
+            summary[name][f"{phase}_ms_avg"] = round(total * 1000 / count, 1)
+    return summary
+
+
+def format_timing_summary(since=0.0):
+    """One log line per exchange describing where request time went."""
+    lines = []
+    for name, s in timing_summary(since=since).items():
+        lines.append(
+            f"  [{name}] {s['requests']} req ({s['new_connections']} new conn, "
+            f"{s['bytes'] // 1024} KiB): connect {s['connect_ms_total']}ms, "
+            f"ttfb {s['ttfb_ms_total']}ms, download {s['download_ms_total']}ms, "
+            f"parse {s['parse_ms_total']}ms, {s['unchanged']} unchanged"
+        )
+    return "\n".join(lines)